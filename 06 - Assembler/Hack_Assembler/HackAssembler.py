@@ -1,56 +1,192 @@
-
 """
 HackAssembler: Translates Hack assembly (.asm) files into binary machine code (.hack).
-This script is part of the solution for Project 6 from the Nand to Tetris course. 
+This script is part of the solution for Project 6 from the Nand to Tetris course.
     https://www.coursera.org/learn/build-a-computer
 Performs two-pass processing: the first to resolve symbols and labels, the second to generate binary code.
+With --stream, a single pass emits code while reading and backpatches forward label references at the end.
+With --packed, a little-endian uint16 image (.hackbin) is written next to the textual .hack file.
+The translation itself lives in assembler.Assembler, which can also be used in-process.
+
+Given a directory or a glob pattern, every matching .asm file is assembled in parallel
+across a process pool; files are reported in sorted order and all failures are listed.
+
+With --cache-dir, outputs are looked up in a content-addressed build cache (see build_cache.py)
+and both passes are skipped when the normalised source has been assembled before.
+With --map, a .hackmap source map (ROM address -> source line, label) is written, and
+with --listing a human readable .lst listing; both bypass the build cache.
+With --optimize, a peephole pass (peephole.py) shrinks the program before labels are resolved.
+With --mmap, the source is memory-mapped and scanned as bytes, for very large inputs.
+With --stats, per-phase timings and instruction/symbol counters are printed as JSON
+(in-process callers get the same data through Assembler(on_phase=...)).
+
+Example usage:
+    python3 HackAssembler.py test/pong/Pong.asm
+    python3 HackAssembler.py test --workers 4
+    python3 HackAssembler.py "test/*/*L.asm"
+    python3 HackAssembler.py test --cache-dir ~/.cache/hack --cache-max-mb 512
 """
 
 
 import os
+import sys
+import glob
 import argparse
-from hack_code import Code
-from symbol_table import symbol_table
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from assembler import Assembler, clean
+from build_cache import BuildCache
+from source_map import write_listing, MAP_EXT, LISTING_EXT
+import rom_file
+
+
+@dataclass(frozen=True)
+class BuildOptions:
+    """What to produce for each assembled file."""
+    streaming: bool = False
+    packed: bool = False
+    source_map: bool = False
+    listing: bool = False
+    optimize: bool = False
+    stats: bool = False
+    use_mmap: bool = False
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("filepath", help="assembly file to read")
+    parser.add_argument("filepath", help="assembly file, directory or glob pattern to read")
+    parser.add_argument("--stream", action="store_true",
+                        help="single pass: emit while reading, backpatch forward references")
+    parser.add_argument("--packed", action="store_true",
+                        help=f"also write a packed binary ROM ({rom_file.PACKED_EXT})")
+    parser.add_argument("--map", action="store_true",
+                        help=f"also write a source map ({MAP_EXT})")
+    parser.add_argument("--listing", action="store_true",
+                        help=f"also write a listing ({LISTING_EXT})")
+    parser.add_argument("--optimize", action="store_true",
+                        help="run the peephole optimiser and report the savings")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per-phase timings and counters as JSON")
+    parser.add_argument("--mmap", action="store_true",
+                        help="memory-map the source and scan it as bytes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes used for directory/glob input (default: CPU count)")
+    parser.add_argument("--cache-dir", help="reuse outputs from this build cache directory")
+    parser.add_argument("--cache-max-mb", type=float, default=None,
+                        help="evict least recently used cache entries above this size")
+    parser.add_argument("--cache-max-days", type=float, default=None,
+                        help="evict cache entries unused for longer than this")
     args = parser.parse_args()
-    file_name = os.path.splitext(args.filepath.strip())[0]
-
-    cleaned_lines: list[str] = []
-    line_number = 0
-
-    # First pass: build symbol table and collect cleaned lines
-    with open(args.filepath, "r") as f:
-        for line in f:
-            code_only = line.split("//")[0]
-            cleaned = "".join(code_only.split())
-            if not cleaned:
-                continue
-            if cleaned.startswith("(") and cleaned.endswith(")"):
-                symbol = cleaned[1:-1]
-                symbol_table[symbol] = line_number
-            else:
-                cleaned_lines.append(cleaned)
-                line_number += 1
-
-    # Second pass: translate to binary
-    n = 16
-    with open(f"{file_name}.hack", "w") as out_f:
-        for line in cleaned_lines:
-            if line.startswith("@"):
-                address = line[1:]
-                if not address.isdigit():
-                    if address not in symbol_table:
-                        symbol_table[address] = n
-                        n += 1
-                    address = symbol_table[address]
-                binary = Code.translate_A(address)
-            else:
-                binary = Code.translate_C(line)
-            out_f.write(binary + "\n")
+    filepath = args.filepath.strip()
+    options = BuildOptions(streaming=args.stream, packed=args.packed,
+                           source_map=args.map, listing=args.listing, optimize=args.optimize,
+                           stats=args.stats, use_mmap=args.mmap)
+
+    cache = None
+    if args.cache_dir:
+        cache = BuildCache(
+            args.cache_dir,
+            max_bytes=None if args.cache_max_mb is None else int(args.cache_max_mb * 2**20),
+            max_age=None if args.cache_max_days is None else args.cache_max_days * 86400,
+        )
+
+    if os.path.isfile(filepath):
+        report = assemble_file(filepath, options, cache)
+        if cache:
+            cache.evict()
+        if report:
+            print(report)
+        return
+
+    input_files = collect_inputs(filepath)
+    if not input_files:
+        sys.exit(f"No .asm files found for {filepath}")
+    results = assemble_all(input_files, options, args.workers, cache)
+    if cache:
+        cache.evict()
+    errors = [(input_file, error) for input_file, error, _ in results if error is not None]
+    for input_file, _, report in results:
+        if report:
+            print(f"{input_file}: {report}")
+    print(f"Assembled {len(input_files) - len(errors)}/{len(input_files)} files.")
+    if errors:
+        for input_file, error in errors:
+            print(f"❌ {input_file}: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+def collect_inputs(filepath: str) -> list[str]:
+    """Expand a directory (recursively) or a glob pattern into a sorted list of .asm files."""
+    if os.path.isdir(filepath):
+        pattern = os.path.join(glob.escape(filepath), "**", "*.asm")
+    else:
+        pattern = filepath
+    return sorted(f for f in glob.glob(pattern, recursive=True) if f.endswith(".asm"))
+
+
+def assemble_file(input_path: str, options: BuildOptions = BuildOptions(),
+                  cache: BuildCache | None = None) -> str | None:
+    """
+    Assemble one .asm file and write the outputs next to it.
+    Returns the optimiser and statistics reports when any was produced.
+    """
+    file_name = os.path.splitext(input_path)[0]
+    outputs = {".hack": f"{file_name}.hack"}
+    if options.packed:
+        outputs[rom_file.PACKED_EXT] = f"{file_name}{rom_file.PACKED_EXT}"
+    track_source = options.source_map or options.listing
+    # Line numbers are not part of the cache key, so source maps are always rebuilt
+    if track_source:
+        cache = None
+
+    assembler = Assembler(track_source=track_source, optimize=options.optimize,
+                          collect_stats=options.stats)
+    if cache is None:
+        words = assembler.assemble_file(input_path, streaming=options.streaming,
+                                        use_mmap=options.use_mmap)
+    else:
+        with open(input_path, "r") as f:
+            cleaned_lines = [cleaned for cleaned in map(clean, f) if cleaned]
+        key = cache.key(cleaned_lines, variant="peephole" if options.optimize else "")
+        if cache.fetch(key, outputs):
+            return "cache hit" if options.stats else None
+        words = assembler.assemble_lines(cleaned_lines, streaming=options.streaming)
+
+    with assembler.timed("write"):
+        rom_file.write_text(words, outputs[".hack"])
+        if options.packed:
+            rom_file.write_packed(words, outputs[rom_file.PACKED_EXT])
+    if options.source_map:
+        assembler.source_map.write(f"{file_name}{MAP_EXT}")
+    if options.listing:
+        write_listing(input_path, words, assembler.source_map, f"{file_name}{LISTING_EXT}")
+    if cache is not None:
+        cache.store(key, outputs)
+    reports = [str(report) for report in (assembler.peephole_stats, assembler.stats) if report]
+    return "\n".join(reports) or None
+
+
+def _assemble_job(input_path: str, options: BuildOptions,
+                  cache: BuildCache | None) -> tuple[str | None, str | None]:
+    """Process pool entry point: assemble one file and return (error, report)."""
+    try:
+        return None, assemble_file(input_path, options, cache)
+    except (OSError, ValueError) as e:
+        return str(e), None
+
+
+def assemble_all(input_files: list[str], options: BuildOptions = BuildOptions(),
+                 workers: int | None = None,
+                 cache: BuildCache | None = None) -> list[tuple[str, str | None, str | None]]:
+    """
+    Assemble many files concurrently. Results are collected in input order,
+    so the report is deterministic regardless of which worker finishes first.
+    Returns one (file, error, report) triple per input file.
+    """
+    n = len(input_files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_assemble_job, input_files, [options] * n, [cache] * n)
+        return [(f, error, report) for f, (error, report) in zip(input_files, results)]
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
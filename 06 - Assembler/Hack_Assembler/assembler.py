@@ -0,0 +1,323 @@
+"""
+assembler.py
+
+Provides the `Assembler` class: an in-process, reentrant Hack assembler.
+Each Assembler owns its symbol table, layered copy-on-write over the predefined
+symbols, so any number of programs can be assembled in one process.
+"""
+import json
+import mmap
+import time
+from array import array
+from collections import ChainMap
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+from hack_code import Code
+from peephole import ROM_LABEL, PeepholeStats, optimize
+from source_map import SourceMap
+from symbol_table import symbol_table
+
+# Bump whenever the generated code can change, so cached builds are invalidated
+ASSEMBLER_VERSION = "3"
+VARIABLE_BASE = 16
+_BLANKS = b" \t\v\f"
+
+Record = tuple[str, int]
+
+
+def clean(line: str) -> str:
+    """Strip comments and every whitespace character from a source line."""
+    code_only = line.split("//")[0]
+    return "".join(code_only.split())
+
+
+def read_records(input_path: str, chunk_size: int = 1 << 16) -> Iterator[Record]:
+    """
+    Yield (cleaned line, line number) records from a memory-mapped source file.
+    The file is scanned in chunks cut at line boundaries; each chunk loses all of its
+    blanks in one bytes.translate and is split into lines once, so the per-line
+    split("//") / split() / join intermediates of clean() are never built. Chunks are
+    kept small so a streaming build only ever holds a few thousand lines at once.
+    Like text mode, "\n", "\r\n" and a lone "\r" all end a line.
+    """
+    with open(input_path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size = len(mapped)
+            start = 0
+            line_number = 0
+            while start < size:
+                end = size
+                if start + chunk_size < size:
+                    newline = max(mapped.rfind(b"\n", start, start + chunk_size),
+                                  mapped.rfind(b"\r", start, start + chunk_size))
+                    if newline < 0:  # a single line longer than the chunk
+                        newline = _next_line_break(mapped, start + chunk_size)
+                    if newline >= 0:
+                        end = newline + 1
+                        if mapped[newline] == ord("\r") and mapped[end:end + 1] == b"\n":
+                            end += 1  # keep a \r\n pair in one chunk
+                chunk = mapped[start:end]
+                if b"\r" in chunk:
+                    chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                lines = chunk.translate(None, _BLANKS).decode().split("\n")
+                if lines[-1] == "":
+                    lines.pop()  # the chunk ended with a newline
+                for line in lines:
+                    line_number += 1
+                    comment = line.find("//")
+                    if comment >= 0:
+                        line = line[:comment]
+                    if line:
+                        yield line, line_number
+                start = end
+
+
+def _next_line_break(mapped: mmap.mmap, start: int) -> int:
+    """Position of the first "\n" or "\r" at or after start, -1 if there is none."""
+    breaks = [pos for pos in (mapped.find(b"\n", start), mapped.find(b"\r", start)) if pos >= 0]
+    return min(breaks, default=-1)
+
+
+@dataclass
+class AssemblerStats:
+    """Seconds spent in each phase of one program, plus instruction and symbol counters."""
+    phases: dict[str, float] = field(default_factory=dict)
+    a_instructions: int = 0
+    c_instructions: int = 0
+    labels: int = 0
+    variables: int = 0
+    symbols: int = 0
+
+    def __str__(self) -> str:
+        return json.dumps(asdict(self))
+
+
+PhaseHook = Callable[[str, float, AssemblerStats], None]
+
+
+class Assembler:
+    """
+    Translates Hack assembly into 16-bit words.
+    Labels and variables are written to `symbols`, a ChainMap whose first map is
+    private to the current program and whose base is the shared predefined table.
+    With track_source=True, `source_map` records the source line and label of every ROM address.
+    With optimize=True, the peephole pass (see peephole.py) rewrites the cleaned program
+    before labels are resolved and `peephole_stats` reports the savings; this needs the
+    whole program, so streaming is ignored.
+    With collect_stats=True (or an on_phase hook), `stats` times every phase and counts
+    instructions and symbols; on_phase(phase, seconds, stats) is called as each phase ends.
+    Records are still read lazily: "read/clean" is the time spent producing them while
+    the first pass (or streaming encode) consumes them, and is left out of that phase.
+    """
+
+    def __init__(self, track_source: bool = False, optimize: bool = False,
+                 collect_stats: bool = False, on_phase: PhaseHook | None = None):
+        self.track_source = track_source
+        self.optimize = optimize
+        self.collect_stats = collect_stats or on_phase is not None
+        self.on_phase = on_phase
+        self.symbols: ChainMap[str, int] = ChainMap({}, symbol_table)
+        self.next_variable = VARIABLE_BASE
+        self.source_map: SourceMap | None = None
+        self.peephole_stats: PeepholeStats | None = None
+        self.stats: AssemblerStats | None = None
+        self._reading = 0.0  # seconds spent producing records so far
+
+    def reset(self) -> None:
+        """Forget the labels and variables of the previous program."""
+        self.symbols = ChainMap({}, symbol_table)
+        self.next_variable = VARIABLE_BASE
+        self.source_map = SourceMap() if self.track_source else None
+        self.stats = AssemblerStats() if self.collect_stats else None
+        self._reading = 0.0
+
+    @contextmanager
+    def timed(self, phase: str):
+        """
+        Time a phase into `stats` and notify the hook. Callers can time their own
+        phases too (e.g. writing the output). Does nothing when stats are off.
+        """
+        if self.stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        reading = self._reading
+        yield
+        seconds = time.perf_counter() - start - (self._reading - reading)
+        self._add_phase(phase, seconds)
+
+    def _add_phase(self, phase: str, seconds: float) -> None:
+        self.stats.phases[phase] = self.stats.phases.get(phase, 0.0) + seconds
+        if self.on_phase is not None:
+            self.on_phase(phase, seconds, self.stats)
+
+    def assemble(self, source: str | bytes, streaming: bool = False) -> array:
+        """Assemble a whole program given as text or bytes and return its words."""
+        if isinstance(source, bytes):
+            source = source.decode()
+        return self.assemble_lines(source.splitlines(), streaming=streaming)
+
+    def assemble_file(self, input_path: str, streaming: bool = False,
+                      use_mmap: bool = False) -> array:
+        """
+        Assemble a .asm file, reading it line by line, or with use_mmap=True by
+        scanning the memory-mapped bytes (see read_records) for very large sources.
+        """
+        if use_mmap:
+            return self.assemble_records(read_records(input_path), streaming=streaming)
+        with open(input_path, "r") as f:
+            return self.assemble_lines(f, streaming=streaming)
+
+    def assemble_lines(self, lines: Iterable[str], streaming: bool = False) -> array:
+        """Assemble an iterable of source lines, starting from a clean symbol table."""
+        records = ((cleaned, line_number)
+                   for line_number, line in enumerate(lines, start=1) if (cleaned := clean(line)))
+        return self.assemble_records(records, streaming=streaming)
+
+    def assemble_records(self, records: Iterable[Record], streaming: bool = False) -> array:
+        """
+        Assemble (cleaned line, line number) records, blank lines already dropped,
+        starting from a clean symbol table.
+        """
+        self.reset()
+        if self.stats is not None:
+            return self._assemble_instrumented(records, streaming)
+        if self.optimize:
+            program, self.peephole_stats = optimize(list(records))
+            return self._second_pass(self._first_pass(program))
+        if streaming:
+            return self._backpatch(*self._stream_encode(records))
+        return self._second_pass(self._first_pass(records))
+
+    def _assemble_instrumented(self, records: Iterable[Record], streaming: bool) -> array:
+        """Same work as assemble_records, with every phase timed."""
+        self.stats.phases["read/clean"] = 0.0
+        records = self._timed_reading(records)
+        if self.optimize:
+            with self.timed("peephole"):
+                records, self.peephole_stats = optimize(list(records))
+        if streaming and not self.optimize:
+            with self.timed("streaming encode"):
+                words, pending = self._stream_encode(records)
+            with self.timed("backpatch"):
+                words = self._backpatch(words, pending)
+        else:
+            with self.timed("first pass"):
+                cleaned_lines = self._first_pass(records)
+            with self.timed("second pass"):
+                words = self._second_pass(cleaned_lines)
+        self._add_phase("read/clean", self._reading)
+
+        stats = self.stats
+        stats.c_instructions = sum(word >> 15 for word in words)
+        stats.a_instructions = len(words) - stats.c_instructions
+        stats.variables = self.next_variable - VARIABLE_BASE
+        # the labels of the source, not the ROM$N ones the peephole pass adds for numeric jumps
+        stats.labels = sum(1 for name in self.symbols.maps[0]
+                           if not name.startswith(ROM_LABEL)) - stats.variables
+        stats.symbols = len(self.symbols)
+        return words
+
+    def _timed_reading(self, records: Iterable[Record]) -> Iterator[Record]:
+        """Yield the records, adding the time spent producing each one to self._reading."""
+        clock = time.perf_counter
+        iterator = iter(records)
+        while True:
+            start = clock()
+            record = next(iterator, None)
+            self._reading += clock() - start
+            if record is None:
+                return
+            yield record
+
+    def _variable(self, symbol: str) -> int:
+        """Return the address of a variable, allocating it on first use."""
+        address = self.symbols.get(symbol)
+        if address is None:
+            address = self.symbols[symbol] = self.next_variable
+            self.next_variable += 1
+        return address
+
+    def _first_pass(self, records: Iterable[Record]) -> list[str]:
+        """
+        Classic two-pass assembly, first pass: collect labels and cleaned instructions.
+        Records are (cleaned line, source line number) pairs, blank lines already dropped.
+        """
+        symbols = self.symbols
+        source_map = self.source_map
+        label = 0
+        cleaned_lines: list[str] = []
+
+        # First pass: build symbol table and collect cleaned lines
+        for cleaned, line_number in records:
+            if cleaned.startswith("(") and cleaned.endswith(")"):
+                symbols[cleaned[1:-1]] = len(cleaned_lines)
+                if source_map is not None:
+                    label = source_map.label_index(cleaned[1:-1])
+            else:
+                cleaned_lines.append(cleaned)
+                if source_map is not None:
+                    source_map.add(line_number, label)
+        return cleaned_lines
+
+    def _second_pass(self, cleaned_lines: list[str]) -> array:
+        """Second pass: encode to 16-bit words, allocating variables on first use."""
+        words = array("H")
+        for line in cleaned_lines:
+            if line.startswith("@"):
+                address = line[1:]
+                if address.isdigit():
+                    words.append(Code.encode_A(int(address)))
+                else:
+                    words.append(Code.encode_A(self._variable(address)))
+            else:
+                words.append(Code.encode_C(line))
+        return words
+
+    def _stream_encode(self, records: Iterable[Record]) -> tuple[array, dict[str, array]]:
+        """
+        Single-pass assembly. Every instruction is encoded as soon as it is read into a
+        compact array of 16-bit words. A-instructions whose symbol is not yet known get a
+        placeholder word and their position is recorded; once the whole input is read,
+        symbols that turned out to be labels are patched in and the rest are allocated
+        as variables (in order of first use, exactly like the two-pass assembler).
+        Peak memory is the word buffer plus the unresolved references only.
+        """
+        symbols = self.symbols
+        source_map = self.source_map
+        label = 0
+        words = array("H")
+        pending: dict[str, array] = {}
+
+        for cleaned, line_number in records:
+            if cleaned.startswith("(") and cleaned.endswith(")"):
+                symbols[cleaned[1:-1]] = len(words)
+                if source_map is not None:
+                    label = source_map.label_index(cleaned[1:-1])
+                continue
+            if source_map is not None:
+                source_map.add(line_number, label)
+            if cleaned.startswith("@"):
+                address = cleaned[1:]
+                if address.isdigit():
+                    words.append(Code.encode_A(int(address)))
+                elif address in symbols:
+                    words.append(Code.encode_A(symbols[address]))
+                else:
+                    pending.setdefault(address, array("I")).append(len(words))
+                    words.append(0)
+            else:
+                words.append(Code.encode_C(cleaned))
+        return words, pending
+
+    def _backpatch(self, words: array, pending: dict[str, array]) -> array:
+        """Labels are now known; whatever is left is a variable."""
+        for symbol, positions in pending.items():
+            address = Code.encode_A(self._variable(symbol))
+            for pos in positions:
+                words[pos] = address
+        return words
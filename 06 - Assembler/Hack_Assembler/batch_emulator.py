@@ -0,0 +1,132 @@
+"""
+batch_emulator.py
+
+Runs N copies of one Hack program in lockstep with NumPy, e.g. to fuzz a routine with
+thousands of different inputs in one process. A, D and PC are vectors with one entry per
+instance and RAM is an (N, 32768) int16 array. Every step picks the PC shared by the most
+running instances and executes that single instruction for all of them at once (the
+comp handlers of hack_emulator work unchanged on arrays); instances whose control flow
+has diverged are masked out until their PC is scheduled.
+
+Example usage (Max.asm on 10000 random pairs, printing RAM[2] of the first instances):
+    python3 batch_emulator.py test/max/Max.asm -n 10000 --cycles 100 --randomize 0 1 --show 2
+"""
+import argparse
+import time
+
+import numpy as np
+
+from hack_emulator import (COMP_FUNCTIONS, COMP_MNEMONICS, DEST_A, DEST_D, DEST_M,
+                           JUMP_EQ, JUMP_GT, JUMP_LT, MEMORY_SIZE, load_program)
+from machine_state import MachineState, load_state
+import rom_file
+
+
+class BatchMachine:
+    """N Hack computers running the same ROM."""
+
+    def __init__(self, rom, instances: int):
+        if len(rom) > MEMORY_SIZE:
+            raise ValueError(f"Program of {len(rom)} words does not fit in the 32K ROM")
+        words = np.zeros(MEMORY_SIZE, dtype=np.uint16)
+        words[:len(rom)] = np.asarray(rom, dtype=np.uint16)
+        self.words = words
+        self.instances = instances
+        self.reset()
+
+    @classmethod
+    def from_file(cls, input_path: str, instances: int) -> "BatchMachine":
+        return cls(load_program(input_path), instances)
+
+    def reset(self) -> None:
+        """Clear the registers and RAM of every instance."""
+        n = self.instances
+        self.ram = np.zeros((n, MEMORY_SIZE), dtype=np.int16)
+        self.A = np.zeros(n, dtype=np.int32)
+        self.D = np.zeros(n, dtype=np.int32)
+        self.pc = np.zeros(n, dtype=np.int32)
+        self.cycles = np.zeros(n, dtype=np.int64)
+        self.steps = 0  # vectorised instructions issued, shared by all active instances
+
+    def restore(self, state: MachineState) -> None:
+        """Start every instance from the same snapshot."""
+        self.pc[:], self.A[:], self.D[:], self.cycles[:] = state.pc, state.A, state.D, state.cycles
+        self.ram[:] = np.frombuffer(state.ram, dtype=np.int16)
+
+    def run(self, max_cycles: int) -> None:
+        """Execute max_cycles more instructions on every instance."""
+        budget = self.cycles + max_cycles
+        ram, A, D, pc, cycles = self.ram, self.A, self.D, self.pc, self.cycles
+        while True:
+            running = np.flatnonzero(cycles < budget)
+            if not len(running):
+                break
+            address = int(np.bincount(pc[running], minlength=1).argmax())
+            active = running[pc[running] == address]
+            self._execute(int(self.words[address]), address, active, ram, A, D, pc)
+            cycles[active] += 1
+            self.steps += 1
+
+    @staticmethod
+    def _execute(word: int, address: int, active: np.ndarray, ram, A, D, pc) -> None:
+        following = (address + 1) & 0x7FFF  # the 15-bit PC wraps at the end of ROM
+        if not word & 0x8000:
+            A[active] = word
+            pc[active] = following
+            return
+        comp = COMP_MNEMONICS.get((word >> 6) & 0x7F)
+        if comp is None:
+            raise ValueError(f"Invalid C-instruction at {address}: {word:016b}")
+        a = A[active]
+        target = a & 0x7FFF
+        out = COMP_FUNCTIONS[comp](a, D[active], ram[active, target].astype(np.int32))
+        out = np.broadcast_to(out, active.shape).astype(np.int32)
+        dest = (word >> 3) & 0b111
+        if dest & DEST_M:
+            ram[active, target] = out
+        if dest & DEST_D:
+            D[active] = out
+        if dest & DEST_A:
+            A[active] = out
+        jump = word & 0b111
+        if jump:
+            taken = (((jump & JUMP_LT) != 0) & (out < 0)) | (((jump & JUMP_EQ) != 0) & (out == 0)) \
+                | (((jump & JUMP_GT) != 0) & (out > 0))
+            pc[active] = np.where(taken, target, following)
+        else:
+            pc[active] = following
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.hack, {rom_file.PACKED_EXT} or .asm)")
+    parser.add_argument("-n", "--instances", type=int, default=1000, help="copies to run")
+    parser.add_argument("--cycles", type=int, default=100_000, help="instructions per instance")
+    parser.add_argument("--randomize", type=int, nargs="*", default=[],
+                        help="RAM addresses given a random value in every instance")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--restore", help="machine state every instance starts from")
+    parser.add_argument("--show", type=int, nargs="*", default=[],
+                        help="RAM addresses to print for the first instances")
+    args = parser.parse_args()
+
+    machine = BatchMachine.from_file(args.filepath, args.instances)
+    if args.restore:
+        machine.restore(load_state(args.restore))
+    rng = np.random.default_rng(args.seed)
+    for address in args.randomize:
+        machine.ram[:, address] = rng.integers(-0x8000, 0x8000, args.instances, dtype=np.int16)
+    start = time.perf_counter()
+    machine.run(args.cycles)
+    seconds = time.perf_counter() - start
+    total = args.instances * args.cycles
+    print(f"{args.instances} x {args.cycles} cycles in {seconds:.3f}s "
+          f"({total / seconds / 1e6:.2f} M instructions/s, {machine.steps} lockstep steps)")
+    for i in range(min(args.instances, 10)):
+        values = " ".join(f"RAM[{address}]={machine.ram[i, address]}"
+                          for address in args.randomize + args.show)
+        print(f"#{i}: pc={machine.pc[i]} {values}")
+
+
+if __name__ == "__main__":
+    main()
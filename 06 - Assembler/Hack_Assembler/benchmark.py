@@ -0,0 +1,210 @@
+"""
+benchmark.py
+
+Measures assembler throughput on the course programs (test/add, max, rect, pong) and on
+synthetic programs scaled up to millions of lines. Each workload runs in a fresh process
+so peak RSS is attributed to that workload alone. Throughput and RSS are measured on the
+plain assembler; per-pass times come from one more, separate run with the assembler's own
+phase instrumentation (Assembler(collect_stats=True)). Results are printed as JSON and can be
+compared against a stored baseline; a throughput drop beyond the tolerance exits with 1,
+which is what CI checks.
+
+Example usage:
+    python3 benchmark.py
+    python3 benchmark.py --sizes 100000 1000000 --labels 0.05 --variables 0.1 --c-instructions 0.5
+    python3 benchmark.py --save-baseline bench_baseline.json
+    python3 benchmark.py --baseline bench_baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import Assembler
+from hack_code import C_TABLE
+import rom_file
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test")
+COURSE_PROGRAMS = {
+    "add": "add/Add.asm",
+    "max": "max/Max.asm",
+    "rect": "rect/Rect.asm",
+    "pong": "pong/Pong.asm",
+}
+
+
+def _line_kinds(n_lines: int, labels: float, variables: float, c_instructions: float, seed: int):
+    """Yield the kind of each synthetic line: "label", "variable", "C" or "A"."""
+    rng = random.Random(seed)
+    variable_cut = labels + variables
+    c_cut = variable_cut + c_instructions
+    for _ in range(n_lines):
+        r = rng.random()
+        if r < labels:
+            yield "label"
+        elif r < variable_cut:
+            yield "variable"
+        elif r < c_cut:
+            yield "C"
+        else:
+            yield "A"
+
+
+def generate_program(output_path: str, n_lines: int, labels: float = 0.02,
+                     variables: float = 0.1, c_instructions: float = 0.55, seed: int = 0) -> None:
+    """
+    Write a synthetic .asm program of n_lines lines. The ratios give the share of label
+    definitions, A-instructions naming a variable and C-instructions; every other line is
+    an A-instruction holding a constant or a label reference (forward or backward).
+    Programs may be far larger than the 32K ROM, so references only name labels that are
+    defined below address 32768 and therefore still fit in an A-instruction.
+    """
+    kinds = (labels, variables, c_instructions, seed)
+    # Dry run over the same kind sequence: count the labels that stay addressable
+    n_addressable = 0
+    address = 0
+    for kind in _line_kinds(n_lines, *kinds):
+        if kind != "label":
+            address += 1
+            if address >= 0x8000:
+                break
+        else:
+            n_addressable += 1
+
+    rng = random.Random(seed + 1)
+    c_texts = list(C_TABLE)
+    n_variables = max(1, min(int(n_lines * variables), 16000))
+    defined = 0
+    with open(output_path, "w") as f:
+        chunk = []
+        for kind in _line_kinds(n_lines, *kinds):
+            if kind == "label":
+                chunk.append(f"(L{defined})\n")
+                defined += 1
+            elif kind == "variable":
+                chunk.append(f"@v{rng.randrange(n_variables)}\n")
+            elif kind == "C":
+                chunk.append(f"{rng.choice(c_texts)}\n")
+            elif n_addressable and rng.random() < 0.5:
+                chunk.append(f"@L{rng.randrange(n_addressable)}\n")
+            else:
+                chunk.append(f"@{rng.randrange(0x8000)}\n")
+            if len(chunk) >= 10000:
+                f.writelines(chunk)
+                chunk = []
+        f.writelines(chunk)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_workload(input_path: str, streaming: bool, collect_stats: bool = False) -> dict:
+    """
+    Assemble one file and return its timings. Meant to run in its own process.
+    With collect_stats=True the per-pass times are included, at the cost of the
+    instrumentation's own overhead in the other numbers.
+    """
+    with open(input_path, "rb") as f:
+        n_lines = sum(1 for _ in f)
+    assembler = Assembler(collect_stats=collect_stats)
+    start = time.perf_counter()
+    words = assembler.assemble_file(input_path, streaming=streaming)
+    with tempfile.TemporaryDirectory() as tmp_dir, assembler.timed("write"):
+        rom_file.write_text(words, os.path.join(tmp_dir, "out.hack"))
+    total = time.perf_counter() - start
+    result = {
+        "lines": n_lines,
+        "instructions": len(words),
+        "seconds": total,
+        "lines_per_sec": n_lines / total if total else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if collect_stats:
+        result["passes"] = assembler.stats.phases
+    return result
+
+
+def _run_in_process(input_path: str, streaming: bool, collect_stats: bool = False) -> dict:
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(run_workload, input_path, streaming, collect_stats).result()
+
+
+def run_benchmarks(workloads: dict[str, str], streaming: bool, repeat: int) -> dict:
+    """
+    Run every workload `repeat` times uninstrumented, each in a fresh process, and keep
+    the fastest run; the per-pass times are added from one instrumented run.
+    """
+    results = {}
+    for name, input_path in workloads.items():
+        best = None
+        for _ in range(repeat):
+            result = _run_in_process(input_path, streaming)
+            if best is None or result["seconds"] < best["seconds"]:
+                best = result
+        best["passes"] = _run_in_process(input_path, streaming, collect_stats=True)["passes"]
+        results[name] = best
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a message for every workload whose throughput fell below the baseline."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        floor = reference["lines_per_sec"] * (1 - tolerance)
+        if result["lines_per_sec"] < floor:
+            regressions.append(f"{name}: {result['lines_per_sec']:.0f} lines/s, "
+                               f"baseline {reference['lines_per_sec']:.0f} lines/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100_000, 1_000_000],
+                        help="line counts of the synthetic programs")
+    parser.add_argument("--labels", type=float, default=0.02, help="share of label definitions")
+    parser.add_argument("--variables", type=float, default=0.1,
+                        help="share of A-instructions naming a variable")
+    parser.add_argument("--c-instructions", type=float, default=0.55,
+                        help="share of C-instructions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stream", action="store_true", help="benchmark the streaming assembler")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per workload (best is kept)")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed throughput drop against the baseline (0.1 = 10%%)")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workloads = {name: os.path.join(TEST_DIR, path) for name, path in COURSE_PROGRAMS.items()}
+        for size in args.sizes:
+            path = os.path.join(tmp_dir, f"synthetic_{size}.asm")
+            generate_program(path, size, args.labels, args.variables, args.c_instructions, args.seed)
+            workloads[f"synthetic_{size}"] = path
+        results = run_benchmarks(workloads, args.stream, args.repeat)
+
+    print(json.dumps(results, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"❌ regression {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
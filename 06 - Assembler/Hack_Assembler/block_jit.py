@@ -0,0 +1,140 @@
+"""
+block_jit.py
+
+A block-level "JIT" for the Hack emulator. The ROM is cut into straight-line basic blocks
+that end at a jump (or after MAX_BLOCK instructions); each block is translated into the
+source of one Python function with the A/D/M updates inlined, compiled with `compile()`
+and cached by start address in an LRU cache. Constants loaded by A-instructions are
+folded into the generated code, so `@i` followed by `M=M+1` becomes `ram[i] = ...`.
+
+The result is exactly the machine state of `HackMachine.run`: whole blocks run while
+they fit in the cycle budget and the interpreter executes the remaining tail.
+
+Example usage:
+    python3 block_jit.py test/pong/Pong.hack --cycles 10000000
+"""
+import argparse
+import re
+import time
+from functools import lru_cache
+
+from hack_code import Code
+from hack_emulator import (COMP_EXPRESSIONS, COMP_MNEMONICS, DEST_A, DEST_D, DEST_M,
+                           MEMORY_SIZE, HackMachine)
+import rom_file
+
+MAX_BLOCK = 64
+
+JUMP_CONDITIONS = {
+    "JGT": "out > 0",
+    "JEQ": "out == 0",
+    "JGE": "out >= 0",
+    "JLT": "out < 0",
+    "JNE": "out != 0",
+    "JLE": "out <= 0",
+    "JMP": "True",
+}
+_JUMP_BY_BITS = {int(bits, 2): JUMP_CONDITIONS.get(mnemonic)
+                 for mnemonic, bits in Code.JUMP.items()}
+_REGISTER = re.compile(r"\b[ADM]\b")
+
+
+def block_source(rom, start: int) -> tuple[str, int]:
+    """
+    Return the source of `def block(ram, A, D)` for the basic block at `start` and its
+    length. The function returns the new (A, D, pc).
+    """
+    body = []
+    a_value = None  # A as a literal while it holds a constant loaded in this block
+    pc = start
+    next_pc = None
+    while next_pc is None:
+        word = rom[pc] if pc < len(rom) else 0
+        pc += 1
+        if not word & 0x8000:
+            a_value = str(word)
+        else:
+            comp = COMP_MNEMONICS.get((word >> 6) & 0x7F)
+            if comp is None:
+                raise ValueError(f"Invalid C-instruction at {pc - 1}: {word:016b}")
+            address = a_value or "A"
+            registers = {"A": address, "D": "D", "M": f"ram[{address}]"}
+            expression = _REGISTER.sub(lambda match: registers[match.group()],
+                                       COMP_EXPRESSIONS[comp])
+            dest = (word >> 3) & 0b111
+            condition = _JUMP_BY_BITS[word & 0b111]
+            # The jump goes to the value A had before this instruction
+            target = a_value
+            if condition and target is None:
+                target = "A & 0x7FFF"
+                if dest & DEST_A:
+                    body.append(f"target = {target}")
+                    target = "target"
+            stores = [store for bit, store in ((DEST_M, f"ram[{address}]"), (DEST_D, "D"), (DEST_A, "A"))
+                      if dest & bit]
+            if (condition and condition != "True") or len(stores) > 1:
+                body.append(f"out = {expression}")
+                expression = "out"
+            body += [f"{store} = {expression}" for store in stores]
+            if dest & DEST_A:
+                a_value = None
+            if condition == "True":
+                next_pc = target
+            elif condition:
+                next_pc = f"{target} if {condition} else {pc}"
+        if next_pc is None and (pc - start >= MAX_BLOCK or pc == MEMORY_SIZE):
+            next_pc = str(pc % MEMORY_SIZE)
+    lines = ["def block(ram, A, D):"]
+    lines += [f"    {line}" for line in body]
+    lines.append(f"    return {a_value or 'A'}, D, {next_pc}")
+    return "\n".join(lines) + "\n", pc - start
+
+
+class JitMachine(HackMachine):
+    """A HackMachine that executes whole compiled basic blocks at a time."""
+
+    def __init__(self, rom, cache_size: int = 4096):
+        super().__init__(rom)
+        self.block = lru_cache(maxsize=cache_size)(self._compile_block)
+
+    def _compile_block(self, start: int):
+        source, length = block_source(self.rom, start)
+        namespace = {}
+        exec(compile(source, f"<hack block {start}>", "exec"), namespace)
+        return namespace["block"], length
+
+    def run(self, max_cycles: int) -> int:
+        block = self.block
+        ram = self.ram
+        A, D, pc = self.A, self.D, self.pc
+        remaining = max_cycles
+        while True:
+            function, length = block(pc)
+            if length > remaining:
+                break
+            A, D, pc = function(ram, A, D)
+            remaining -= length
+        self.A, self.D, self.pc = A, D, pc
+        self.cycles += max_cycles - remaining
+        return max_cycles - remaining + super().run(remaining)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.hack, {rom_file.PACKED_EXT} or .asm)")
+    parser.add_argument("--cycles", type=int, default=10_000_000, help="instructions to execute")
+    parser.add_argument("--cache-size", type=int, default=4096, help="compiled blocks to keep")
+    args = parser.parse_args()
+
+    machine = JitMachine.from_file(args.filepath, cache_size=args.cache_size)
+    start = time.perf_counter()
+    machine.run(args.cycles)
+    seconds = time.perf_counter() - start
+    info = machine.block.cache_info()
+    print(f"{machine.cycles} cycles in {seconds:.3f}s "
+          f"({machine.cycles / seconds / 1e6:.2f} M instructions/s), pc={machine.pc}, "
+          f"{info.currsize} blocks compiled, {info.hits} hits / {info.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
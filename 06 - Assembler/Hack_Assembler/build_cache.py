@@ -0,0 +1,107 @@
+"""
+build_cache.py
+
+A content-addressed cache of assembled programs, in the spirit of CPython's __pycache__.
+Entries are keyed by the SHA-256 of the normalised source (comments and whitespace
+stripped, see assembler.clean) together with the assembler version tag, so comment-only
+edits still hit and a new assembler release never reuses stale output.
+
+A hit hard-links (or copies, across file systems) the cached ROM files into place and
+skips both assembly passes. Entries are evicted by age and by the total cache size,
+least recently used first.
+"""
+import hashlib
+import os
+import shutil
+import time
+from collections.abc import Iterable
+
+from assembler import ASSEMBLER_VERSION
+
+
+class BuildCache:
+    """An on-disk store of `<key><ext>` files (e.g. `3fa1...c2.hack`)."""
+
+    def __init__(self, cache_dir: str, max_bytes: int | None = None, max_age: float | None = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(cleaned_lines: Iterable[str], variant: str = "") -> str:
+        """
+        Hash the normalised source lines together with the assembler version and
+        a variant tag naming any option that changes the output (e.g. "peephole").
+        """
+        digest = hashlib.sha256(f"hack-asm {ASSEMBLER_VERSION} {variant}\n".encode())
+        for line in cleaned_lines:
+            digest.update(line.encode())
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def _entry(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key + ext)
+
+    def fetch(self, key: str, outputs: dict[str, str]) -> bool:
+        """
+        Place the cached files for `key` at the given outputs ({ext: output_path}).
+        Returns False, touching nothing, unless every requested format is cached.
+        """
+        entries = {ext: self._entry(key, ext) for ext in outputs}
+        if not all(os.path.exists(entry) for entry in entries.values()):
+            return False
+        for ext, output_path in outputs.items():
+            _link_or_copy(entries[ext], output_path)
+            os.utime(entries[ext])  # mark as recently used for eviction
+        return True
+
+    def store(self, key: str, outputs: dict[str, str]) -> None:
+        """Copy freshly written outputs ({ext: output_path}) into the cache."""
+        for ext, output_path in outputs.items():
+            _link_or_copy(output_path, self._entry(key, ext), link=False)
+
+    def evict(self) -> int:
+        """
+        Remove entries older than max_age seconds, then the least recently used ones
+        until the cache fits in max_bytes. Returns the number of files removed.
+        """
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker evicted it first
+            total -= size
+            removed += 1
+        return removed
+
+
+def _link_or_copy(src: str, dst: str, link: bool = True) -> None:
+    """Atomically make dst a hard link to (or a copy of) src."""
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    try:
+        if link:
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                shutil.copyfile(src, tmp_path)
+        else:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
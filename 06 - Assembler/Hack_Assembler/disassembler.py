@@ -0,0 +1,110 @@
+"""
+disassembler.py
+
+Translates a Hack ROM (.hack or packed .hackbin) back into readable assembly.
+The whole ROM is decoded at once: the Code.COMPUTATION, DESTINATION and JUMP tables are
+inverted into one lookup array holding the text of every possible 16-bit word, and the
+uint16 ROM is used as an index into it. Each line carries its ROM address as a comment,
+so the output is valid assembly again. A word whose comp field is no Hack computation
+becomes a comment too (`// invalid: <bits>`), so the output still assembles, but
+without that word.
+
+Given the source map written by `HackAssembler.py --map`, label definitions are restored
+and jump targets are printed by name.
+
+Example usage:
+    python3 disassembler.py test/pong/Pong.hack
+    python3 disassembler.py test/pong/Pong.hackbin --map test/pong/Pong.hackmap -o Pong.dis.asm
+"""
+import argparse
+import os
+
+import numpy as np
+
+from hack_code import Code
+import rom_file
+from source_map import SourceMap, MAP_EXT
+
+C_BIT = 0x8000
+JUMP_MASK = 0b111
+
+
+def _build_word_table() -> np.ndarray:
+    """Return an object array with the assembly text of all 65536 words."""
+    comp_names = np.full(128, None, dtype=object)
+    for mnemonic, bits in Code.COMPUTATION.items():
+        comp_names[int(bits, 2)] = mnemonic
+    dest_names = [""] * 8
+    for mnemonic, bits in Code.DESTINATION.items():
+        dest_names[int(bits, 2)] = f"{mnemonic}=" if mnemonic else ""
+    jump_names = [""] * 8
+    for mnemonic, bits in Code.JUMP.items():
+        jump_names[int(bits, 2)] = f";{mnemonic}" if mnemonic else ""
+
+    table = np.empty(0x10000, dtype=object)
+    table[:C_BIT] = [f"@{n}" for n in range(C_BIT)]
+    # Like the CPU, ignore the two unused bits below the instruction bit
+    for low in range(0x2000):
+        comp = comp_names[(low >> 6) & 0x7F]
+        if comp is None:
+            text = f"// invalid: {0xE000 | low:016b}"
+        else:
+            text = dest_names[(low >> 3) & 0b111] + comp + jump_names[low & JUMP_MASK]
+        table[C_BIT | low: 0x10000: 0x2000] = text
+    return table
+
+
+WORD_TABLE = _build_word_table()
+
+
+def decode(words) -> np.ndarray:
+    """Decode a sequence of 16-bit words into an array of assembly strings."""
+    return WORD_TABLE[np.asarray(words, dtype=np.uint16)]
+
+
+def disassemble(words, source_map: SourceMap | None = None) -> list[str]:
+    """
+    Return assembly lines for a ROM. With a source map, each label is emitted where its
+    scope starts and A-instructions that feed a jump show the label name.
+    """
+    words = np.asarray(words, dtype=np.uint16)
+    texts = decode(words)
+    label_at: dict[int, str] = {}
+
+    if source_map is not None and len(source_map):
+        labels = np.asarray(source_map.labels, dtype=np.uint32)
+        starts = np.flatnonzero(np.diff(labels, prepend=0) != 0)
+        names = source_map.names
+        label_at = {int(address): names[labels[address]] for address in starts if labels[address]}
+        # A-instructions directly followed by a jump: addresses, not data
+        is_jump = ((words[1:] & C_BIT) != 0) & ((words[1:] & JUMP_MASK) != 0)
+        feeds_jump = np.flatnonzero(((words[:-1] & C_BIT) == 0) & is_jump)
+        for address in feeds_jump:
+            name = label_at.get(int(words[address]))
+            if name is not None:
+                texts[address] = f"@{name}"
+
+    lines = []
+    for address, text in enumerate(texts):
+        if address in label_at:
+            lines.append(f"({label_at[address]})")
+        lines.append(f"    {text:<32}// {address}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"ROM to read (.hack or {rom_file.PACKED_EXT})")
+    parser.add_argument("--map", help=f"source map ({MAP_EXT}) used to restore label names")
+    parser.add_argument("-o", "--output", help="output file (default: <name>.dis.asm)")
+    args = parser.parse_args()
+
+    words = rom_file.read_rom(args.filepath)
+    source_map = SourceMap.load(args.map) if args.map else None
+    output_path = args.output or f"{os.path.splitext(args.filepath)[0]}.dis.asm"
+    with open(output_path, "w") as out_f:
+        out_f.write("\n".join(disassemble(words, source_map)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
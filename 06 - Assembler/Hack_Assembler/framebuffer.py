@@ -0,0 +1,110 @@
+"""
+framebuffer.py
+
+Turns the Hack screen map (RAM[16384..24575], 256 rows of 32 words, pixel x of a row is
+bit x % 16 of word x // 16, 1 = black) into images. The previous frame's words are kept,
+so each update compares all 8K words in one vectorised operation and only the rows that
+changed are unpacked into the 512x256 pixel array.
+
+Frames are written as PPM (P6), PNG (1-bit greyscale) or a raw 512x256 bitmap (one bit
+per pixel, rows top to bottom, leftmost pixel in the most significant bit, 1 = black).
+
+Example usage (one PNG every 500000 cycles of Pong):
+    python3 framebuffer.py test/pong/Pong.hack --frames 20 --every 500000 -o frames --format png
+"""
+import argparse
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from hack_emulator import KBD, SCREEN, HackMachine
+import rom_file
+
+WIDTH = 512
+HEIGHT = 256
+ROW_WORDS = WIDTH // 16
+FORMATS = ("ppm", "png", "raw")
+
+
+class FrameBuffer:
+    """The last frame seen on a machine's screen, refreshed row by row."""
+
+    def __init__(self, machine: HackMachine):
+        self.machine = machine
+        self.words = np.zeros((HEIGHT, ROW_WORDS), dtype="<u2")
+        self.pixels = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        self.frames = 0
+
+    def screen_words(self) -> np.ndarray:
+        """A (256, 32) view of the screen map in the machine's current RAM."""
+        ram = np.frombuffer(self.machine.ram, dtype=np.int16)
+        return ram[SCREEN:KBD].view(np.uint16).reshape(HEIGHT, ROW_WORDS)
+
+    def update(self) -> np.ndarray:
+        """Pick up the screen changes since the last update; returns the dirty row indices."""
+        current = self.screen_words()
+        dirty = np.flatnonzero((current != self.words).any(axis=1))
+        if len(dirty):
+            self.words[dirty] = current[dirty]
+            # Little-endian words as bytes, least significant bit first: pixel order
+            rows = self.words[dirty].view(np.uint8)
+            self.pixels[dirty] = np.unpackbits(rows, axis=1, bitorder="little")
+        self.frames += 1
+        return dirty
+
+    def bitmap(self) -> bytes:
+        """The raw 512x256 bitmap, 1 bit per pixel, most significant bit leftmost."""
+        return np.packbits(self.pixels, axis=1).tobytes()
+
+    def write_ppm(self, output_path: str) -> None:
+        rgb = np.repeat(np.where(self.pixels, 0, 255).astype(np.uint8), 3, axis=1)
+        with rom_file.atomic_write(output_path, "wb") as out_f:
+            out_f.write(f"P6\n{WIDTH} {HEIGHT}\n255\n".encode())
+            out_f.write(rgb.tobytes())
+
+    def write_png(self, output_path: str) -> None:
+        # 1-bit greyscale stores 1 as white, so the packed rows are inverted
+        rows = np.packbits(1 - self.pixels, axis=1)
+        raw = np.hstack([np.zeros((HEIGHT, 1), dtype=np.uint8), rows]).tobytes()
+        with rom_file.atomic_write(output_path, "wb") as out_f:
+            out_f.write(b"\x89PNG\r\n\x1a\n")
+            out_f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", WIDTH, HEIGHT, 1, 0, 0, 0, 0)))
+            out_f.write(_png_chunk(b"IDAT", zlib.compress(raw)))
+            out_f.write(_png_chunk(b"IEND", b""))
+
+    def write_raw(self, output_path: str) -> None:
+        with rom_file.atomic_write(output_path, "wb") as out_f:
+            out_f.write(self.bitmap())
+
+    def write(self, output_path: str, image_format: str) -> None:
+        {"ppm": self.write_ppm, "png": self.write_png, "raw": self.write_raw}[image_format](output_path)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.hack, {rom_file.PACKED_EXT} or .asm)")
+    parser.add_argument("--frames", type=int, default=10, help="frames to record")
+    parser.add_argument("--every", type=int, default=500_000, help="cycles between frames")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("-o", "--output-dir", default="frames")
+    args = parser.parse_args()
+
+    machine = HackMachine.from_file(args.filepath)
+    screen = FrameBuffer(machine)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for frame in range(args.frames):
+        machine.run(args.every)
+        dirty = screen.update()
+        output_path = os.path.join(args.output_dir, f"frame_{frame:04d}.{args.format}")
+        screen.write(output_path, args.format)
+        print(f"{output_path}: cycle {machine.cycles}, {len(dirty)} dirty rows")
+
+
+if __name__ == "__main__":
+    main()
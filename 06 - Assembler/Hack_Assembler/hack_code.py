@@ -68,6 +68,34 @@ class Code:
         Translate a C-instruction into its 16-bit binary representation.
         Splits the instruction into dest, comp, and jump fields and encodes them.
         """
+        return format(cls.encode_C(clean_line), "016b")
+
+    @staticmethod
+    def encode_A(address: int) -> int:
+        """
+        Encode an A-instruction address as a 16-bit word.
+        """
+        if not 0 <= address < 0x8000:
+            raise ValueError(f"A-instruction address out of range: {address}")
+        return address
+
+    @classmethod
+    def encode_C(cls, clean_line: str) -> int:
+        """
+        Encode a C-instruction as a 16-bit word with a single lookup in C_TABLE.
+        Falls back to field splitting only to report which field is invalid.
+        """
+        word = C_TABLE.get(clean_line)
+        if word is None:
+            cls._split_C(clean_line)
+            raise ValueError(f"Invalid C-instruction: '{clean_line}'")
+        return word
+
+    @classmethod
+    def _split_C(cls, clean_line: str) -> tuple[str, str, str]:
+        """
+        Split a C-instruction into its dest, comp, and jump fields and validate them.
+        """
         if "=" in clean_line:
             dest, rest = clean_line.split("=", 1)
         else:
@@ -77,17 +105,31 @@ class Code:
         else:
             comp, jump = rest, ""
 
-        comp_bits = cls.COMPUTATION.get(comp)
-        dest_bits = cls.DESTINATION.get(dest)
-        jump_bits = cls.JUMP.get(jump)
-
-        if comp_bits is None:
+        if comp not in cls.COMPUTATION:
             raise ValueError(f"Invalid comp field: '{comp}'")
-        if dest_bits is None:
+        if dest not in cls.DESTINATION:
             raise ValueError(f"Invalid dest field: '{dest}'")
-        if jump_bits is None:
+        if jump not in cls.JUMP:
             raise ValueError(f"Invalid jump field: '{jump}'")
-        return "111" + comp_bits + dest_bits + jump_bits
-    
+        return dest, comp, jump
+
+
+def _build_C_table() -> dict[str, int]:
+    """
+    Precompute the word of every valid dest/comp/jump combination,
+    keyed by its cleaned source text (e.g. "AM=M-1", "D;JGT", "0;JMP").
+    """
+    table: dict[str, int] = {}
+    for comp, comp_bits in Code.COMPUTATION.items():
+        for dest, dest_bits in Code.DESTINATION.items():
+            for jump, jump_bits in Code.JUMP.items():
+                text = comp
+                if dest:
+                    text = f"{dest}={text}"
+                if jump:
+                    text = f"{text};{jump}"
+                table[text] = int("111" + comp_bits + dest_bits + jump_bits, 2)
+    return table
+
 
- 
\ No newline at end of file
+C_TABLE = _build_C_table()
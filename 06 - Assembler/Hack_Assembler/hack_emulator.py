@@ -0,0 +1,212 @@
+"""
+hack_emulator.py
+
+A Hack machine emulator that runs assembled programs (.hack, .hackbin or .asm) headless.
+Every ROM word is predecoded once into a (kind, handler, dest, jump) tuple: A-instructions
+carry their constant, C-instructions carry the comp function looked up through the
+Code.COMPUTATION table, so the dispatch loop only unpacks a tuple and calls one function
+per C-instruction. RAM is an array('h') of 32K signed 16-bit words; the screen map starts
+at 16384 and the keyboard register is at 24576.
+
+Example usage:
+    python3 hack_emulator.py test/pong/Pong.hack --cycles 10000000
+    python3 hack_emulator.py test/pong/Pong.hack --cycles 2000000 --save pong_started.hackstate
+    python3 hack_emulator.py test/pong/Pong.hack --restore pong_started.hackstate
+"""
+import argparse
+import time
+from array import array
+from collections.abc import Sequence
+from itertools import repeat
+
+from assembler import Assembler
+from hack_code import Code
+from machine_state import MachineState, load_state, write_state
+import rom_file
+
+MEMORY_SIZE = 0x8000
+SCREEN = 0x4000
+KBD = 0x6000
+
+A_INSTRUCTION = 0
+C_INSTRUCTION = 1
+
+# Destination bits, in the order of Code.DESTINATION (d1 d2 d3 = A D M)
+DEST_M = 0b001
+DEST_D = 0b010
+DEST_A = 0b100
+
+# Jump bits (j1 j2 j3 = out < 0, out == 0, out > 0)
+JUMP_LT = 0b100
+JUMP_EQ = 0b010
+JUMP_GT = 0b001
+
+# Every computation as a Python expression over A, D and M, wrapped to a signed 16-bit result
+COMP_EXPRESSIONS = {
+    "0":   "0",
+    "1":   "1",
+    "-1":  "-1",
+    "D":   "D",
+    "A":   "A",
+    "M":   "M",
+    "!D":  "~D",
+    "!A":  "~A",
+    "!M":  "~M",
+    "-D":  "((0x8000 - D) & 0xFFFF) - 0x8000",
+    "-A":  "((0x8000 - A) & 0xFFFF) - 0x8000",
+    "-M":  "((0x8000 - M) & 0xFFFF) - 0x8000",
+    "D+1": "((D + 0x8001) & 0xFFFF) - 0x8000",
+    "A+1": "((A + 0x8001) & 0xFFFF) - 0x8000",
+    "M+1": "((M + 0x8001) & 0xFFFF) - 0x8000",
+    "D-1": "((D + 0x7FFF) & 0xFFFF) - 0x8000",
+    "A-1": "((A + 0x7FFF) & 0xFFFF) - 0x8000",
+    "M-1": "((M + 0x7FFF) & 0xFFFF) - 0x8000",
+    "D+A": "((D + A + 0x8000) & 0xFFFF) - 0x8000",
+    "D+M": "((D + M + 0x8000) & 0xFFFF) - 0x8000",
+    "D-A": "((D - A + 0x8000) & 0xFFFF) - 0x8000",
+    "D-M": "((D - M + 0x8000) & 0xFFFF) - 0x8000",
+    "A-D": "((A - D + 0x8000) & 0xFFFF) - 0x8000",
+    "M-D": "((M - D + 0x8000) & 0xFFFF) - 0x8000",
+    "D&A": "D & A",
+    "D&M": "D & M",
+    "D|A": "D | A",
+    "D|M": "D | M",
+}
+COMP_FUNCTIONS = {mnemonic: eval(f"lambda A, D, M: {expression}")
+                  for mnemonic, expression in COMP_EXPRESSIONS.items()}
+COMP_MNEMONICS = {int(bits, 2): mnemonic for mnemonic, bits in Code.COMPUTATION.items()}
+_COMP_BY_BITS = {bits: COMP_FUNCTIONS[mnemonic] for bits, mnemonic in COMP_MNEMONICS.items()}
+
+Instruction = tuple[int, object, int, int]
+NOP: Instruction = (A_INSTRUCTION, 0, 0, 0)  # what empty ROM decodes to (@0)
+
+
+def predecode(word: int) -> Instruction:
+    """Decode one ROM word into (kind, handler or constant, dest bits, jump bits)."""
+    if not word & 0x8000:
+        return (A_INSTRUCTION, word, 0, 0)
+    comp = _COMP_BY_BITS.get((word >> 6) & 0x7F)
+    if comp is None:
+        raise ValueError(f"Invalid C-instruction: {word:016b}")
+    return (C_INSTRUCTION, comp, (word >> 3) & 0b111, word & 0b111)
+
+
+# The dispatch loop, compiled once plain (HackMachine.run) and once with a per-address
+# instruction counter (the profiler), so its semantics are written down in one place only
+_RUN_LOOP = """
+def run_loop(code, ram, A, D, pc, max_cycles, counts=None):
+    for _ in repeat(None, max_cycles):
+        COUNT
+        kind, handler, dest, jump = code[pc]
+        if kind == A_INSTRUCTION:
+            A = handler
+            pc = (pc + 1) & 0x7FFF  # the 15-bit PC wraps at the end of ROM
+            continue
+        # Negative A indexes from the end of RAM, i.e. wraps to A & 0x7FFF like the hardware
+        out = handler(A, D, ram[A])
+        target = A
+        if dest:
+            if dest & DEST_M:
+                ram[A] = out
+            if dest & DEST_D:
+                D = out
+            if dest & DEST_A:
+                A = out
+        if jump and jump & (JUMP_LT if out < 0 else JUMP_GT if out else JUMP_EQ):
+            pc = target & 0x7FFF
+        else:
+            pc = (pc + 1) & 0x7FFF
+    return A, D, pc
+"""
+
+
+def _compile_run_loop(count: bool):
+    namespace: dict[str, object] = {}
+    source = _RUN_LOOP.replace("COUNT", "counts[pc] += 1" if count else "")
+    exec(compile(source, f"<run_loop count={count}>", "exec"), globals(), namespace)
+    return namespace["run_loop"]
+
+
+# run_loop(code, ram, A, D, pc, max_cycles) -> (A, D, pc); the counted one also takes counts
+run_loop = _compile_run_loop(count=False)
+run_loop_counted = _compile_run_loop(count=True)
+
+
+def load_program(input_path: str) -> Sequence[int]:
+    """Load ROM words from a .hack/.hackbin image or assemble an .asm source."""
+    if input_path.endswith(".asm"):
+        return Assembler().assemble_file(input_path)
+    return rom_file.read_rom(input_path)
+
+
+class HackMachine:
+    """CPU registers, RAM and predecoded ROM of one Hack computer."""
+
+    def __init__(self, rom: Sequence[int]):
+        if len(rom) > MEMORY_SIZE:
+            raise ValueError(f"Program of {len(rom)} words does not fit in the 32K ROM")
+        cache: dict[int, Instruction] = {}
+        self.rom = array("H", rom)
+        self.code: list[Instruction] = [cache.get(word) or cache.setdefault(word, predecode(word))
+                                        for word in rom]
+        self.code.extend(repeat(NOP, MEMORY_SIZE - len(self.code)))
+        self.ram = array("h", bytes(2 * MEMORY_SIZE))
+        self.A = 0
+        self.D = 0
+        self.pc = 0
+        self.cycles = 0
+
+    @classmethod
+    def from_file(cls, input_path: str, **kwargs) -> "HackMachine":
+        return cls(load_program(input_path), **kwargs)
+
+    def reset(self) -> None:
+        """Clear the registers and RAM, as after power-on."""
+        self.ram = array("h", bytes(2 * MEMORY_SIZE))
+        self.A = self.D = self.pc = self.cycles = 0
+
+    def state(self) -> MachineState:
+        """A snapshot of the machine; its RAM is a copy that does not change as the machine runs."""
+        return MachineState(self.pc, self.A, self.D, self.cycles, array("h", self.ram))
+
+    def restore(self, state: MachineState) -> None:
+        """
+        Continue from a snapshot. Its RAM (mapped by load_state or in memory) is copied,
+        so running never changes the snapshot and it can be restored any number of times.
+        """
+        self.pc, self.A, self.D, self.cycles, ram = state
+        self.ram = array("h", ram)
+
+    def run(self, max_cycles: int) -> int:
+        """Execute max_cycles instructions and return how many were executed."""
+        self.A, self.D, self.pc = run_loop(self.code, self.ram, self.A, self.D, self.pc, max_cycles)
+        self.cycles += max_cycles
+        return max_cycles
+
+    def step(self) -> None:
+        """Execute a single instruction."""
+        self.run(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.hack, {rom_file.PACKED_EXT} or .asm)")
+    parser.add_argument("--cycles", type=int, default=10_000_000, help="instructions to execute")
+    parser.add_argument("--restore", help="machine state to start from")
+    parser.add_argument("--save", help="write the final machine state to this file")
+    args = parser.parse_args()
+
+    machine = HackMachine.from_file(args.filepath)
+    if args.restore:
+        machine.restore(load_state(args.restore))
+    start = time.perf_counter()
+    machine.run(args.cycles)
+    seconds = time.perf_counter() - start
+    print(f"{machine.cycles} cycles in {seconds:.3f}s "
+          f"({args.cycles / seconds / 1e6:.2f} M instructions/s), pc={machine.pc}")
+    if args.save:
+        write_state(machine.state(), args.save)
+
+
+if __name__ == "__main__":
+    main()
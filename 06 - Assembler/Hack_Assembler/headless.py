@@ -0,0 +1,152 @@
+"""
+headless.py
+
+Deterministic headless runs of interactive Hack programs. A key script says at which
+cycle which key code is written to the keyboard register (RAM[24576], 0 = no key); the
+run stops at the cycle budget or when the program halts, and produces a JSON result
+with the cycle count and SHA-256 hashes of the final RAM and screen, so games can be
+regression-tested and benchmarked without a UI or wall-clock timing.
+
+A program has halted when its whole state (PC, A, D and RAM) repeats within a few
+hundred instructions while no key event is pending: it is in an input-free infinite
+loop such as Sys.halt or the `(END) @END 0;JMP` of the course test programs.
+
+Key scripts have one `<cycle> <key>` pair per line (`#` starts a comment). A key is a
+code, a single character or one of the names in KEY_CODES:
+
+    # Pong: move the bat left for a while, then release
+    2000000 LEFT
+    2600000 0
+
+Example usage:
+    python3 headless.py test/pong/Pong.hack --keys pong.keys --max-cycles 50000000 --jit
+    python3 headless.py test/rect/Rect.asm --ram 0=50 --max-cycles 1000000
+"""
+import argparse
+import hashlib
+import json
+import sys
+from array import array
+from dataclasses import asdict, dataclass
+
+from block_jit import JitMachine
+from hack_emulator import KBD, SCREEN, HackMachine, load_program
+import rom_file
+
+CHECK_INTERVAL = 100_000
+IDLE_WINDOW = 256
+KEY_CODES = {
+    "NEWLINE": 128, "BACKSPACE": 129, "LEFT": 130, "UP": 131, "RIGHT": 132, "DOWN": 133,
+    "HOME": 134, "END": 135, "PAGEUP": 136, "PAGEDOWN": 137, "INSERT": 138, "DELETE": 139,
+    "ESC": 140, **{f"F{n}": 140 + n for n in range(1, 13)}, "SPACE": 32,
+}
+
+KeyScript = list[tuple[int, int]]
+
+
+@dataclass
+class RunResult:
+    cycles: int
+    halted: bool
+    pc: int
+    ram_sha256: str
+    screen_sha256: str
+
+    def __str__(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+def key_code(key: str) -> int:
+    if key.upper() in KEY_CODES:
+        return KEY_CODES[key.upper()]
+    if key.lstrip("-").isdigit():
+        return int(key)
+    if len(key) == 1:
+        return ord(key)
+    raise ValueError(f"Unknown key: '{key}'")
+
+
+def parse_key_script(lines) -> KeyScript:
+    """Parse `<cycle> <key>` lines into (cycle, key code) events sorted by cycle."""
+    events = []
+    for line in lines:
+        fields = line.split("#")[0].split()
+        if not fields:
+            continue
+        if len(fields) != 2 or not fields[0].isdigit():
+            raise ValueError(f"Invalid key script line: '{line.strip()}'")
+        events.append((int(fields[0]), key_code(fields[1])))
+    return sorted(events)
+
+
+def is_idle(machine: HackMachine, window: int = IDLE_WINDOW) -> bool:
+    """
+    Step up to `window` instructions and report whether the machine comes back to the
+    exact same state (PC, A, D and RAM). Without new input it then loops forever.
+    """
+    pc, A, D, ram = machine.pc, machine.A, machine.D, bytes(machine.ram)
+    for _ in range(window):
+        machine.step()
+        if machine.pc == pc and machine.A == A and machine.D == D and bytes(machine.ram) == ram:
+            return True
+    return False
+
+
+def _hash(words) -> str:
+    words = array("h", words)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return hashlib.sha256(words.tobytes()).hexdigest()
+
+
+def run_headless(machine: HackMachine, keys: KeyScript = (), max_cycles: int = 10_000_000,
+                 check_interval: int = CHECK_INTERVAL) -> RunResult:
+    """
+    Run until max_cycles or a halt, writing each scripted key code to KBD at its cycle.
+    The halt check runs every check_interval cycles, so results only depend on the
+    program, the script and these two numbers.
+    """
+    events = iter(sorted(keys))
+    event = next(events, None)
+    halted = False
+    while machine.cycles < max_cycles:
+        while event is not None and event[0] <= machine.cycles:
+            machine.ram[KBD] = event[1]
+            event = next(events, None)
+        stop = min(max_cycles, machine.cycles + check_interval)
+        if event is not None:
+            stop = min(stop, event[0])
+        machine.run(stop - machine.cycles)
+        window = min(IDLE_WINDOW, max_cycles - machine.cycles)
+        if event is None and is_idle(machine, window):
+            halted = True
+            break
+    return RunResult(machine.cycles, halted, machine.pc,
+                     _hash(machine.ram), _hash(machine.ram[SCREEN:KBD]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.hack, {rom_file.PACKED_EXT} or .asm)")
+    parser.add_argument("--keys", help="key script file")
+    parser.add_argument("--max-cycles", type=int, default=10_000_000, help="cycle budget")
+    parser.add_argument("--check-interval", type=int, default=CHECK_INTERVAL,
+                        help="cycles between halt checks")
+    parser.add_argument("--ram", nargs="*", default=[], metavar="ADDRESS=VALUE",
+                        help="initial RAM values")
+    parser.add_argument("--jit", action="store_true", help="run with the basic-block JIT")
+    args = parser.parse_args()
+
+    keys = []
+    if args.keys:
+        with open(args.keys, "r") as f:
+            keys = parse_key_script(f)
+    machine = (JitMachine if args.jit else HackMachine)(load_program(args.filepath))
+    for assignment in args.ram:
+        address, value = assignment.split("=")
+        machine.ram[int(address)] = int(value)
+    print(run_headless(machine, keys, args.max_cycles, args.check_interval))
+
+
+if __name__ == "__main__":
+    main()
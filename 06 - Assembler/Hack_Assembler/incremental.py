@@ -0,0 +1,216 @@
+"""
+incremental.py
+
+Provides `IncrementalAssembler`, which keeps the previous program, its words and its
+label table between builds. A new version of the source is diffed against the previous
+one (common prefix and suffix of the cleaned instruction stream); only the changed
+region is encoded again, labels after it are shifted, and every A-instruction that
+refers to a moved label is patched in place.
+
+The result is always identical to a full build. Whenever that cannot be guaranteed
+cheaply - a variable would be allocated, or its first use moves; a label is removed,
+redefined or used to be a variable - the build falls back to a full rebuild.
+
+Example usage (re-assembles whenever the file changes):
+    python3 incremental.py test/pong/Pong.asm --watch
+"""
+import argparse
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+
+from assembler import VARIABLE_BASE, clean, read_records
+from hack_code import Code
+import rom_file
+from symbol_table import symbol_table
+
+
+class _FullRebuild(Exception):
+    """Raised when an edit cannot be applied incrementally."""
+
+
+def _is_label(text: str) -> bool:
+    return text.startswith("(")
+
+
+def _count_instructions(records: list[str]) -> int:
+    return sum(1 for text in records if not _is_label(text))
+
+
+class IncrementalAssembler:
+    """Assembles successive versions of one program, re-encoding only what changed."""
+
+    def __init__(self):
+        self.program: list[str] = []
+        self.words = array("H")
+        self.labels: dict[str, int] = {}
+        self.variables: dict[str, int] = {}
+        self.first_use: dict[str, int] = {}  # variable -> index in program of its first use
+        self.refs: list[tuple[int, str]] = []  # (ROM address, label) of label references, sorted
+        self.full_builds = 0
+        self.incremental_builds = 0
+
+    def assemble_file(self, input_path: str) -> array:
+        return self.update([text for text, _ in read_records(input_path)])
+
+    def assemble_lines(self, lines: Iterable[str]) -> array:
+        return self.update([cleaned for cleaned in map(clean, lines) if cleaned])
+
+    def update(self, program: list[str]) -> array:
+        """Assemble a new version of the cleaned program and return its words."""
+        if self.program:
+            try:
+                words = self._update_region(program)
+                self.incremental_builds += 1
+                return words
+            except _FullRebuild:
+                pass
+        self.full_builds += 1
+        return self._full_build(program)
+
+    def _full_build(self, program: list[str]) -> array:
+        self.labels = self._scan_labels(program, 0, 0)
+        self.variables = {}
+        self.first_use = {}
+        self.words, self.refs = self._encode(program, 0, 0, self.labels, self.first_use,
+                                             allocate=True)
+        self.program = program
+        return self.words
+
+    def _update_region(self, program: list[str]) -> array:
+        old = self.program
+        n = min(len(old), len(program))
+        prefix = 0
+        while prefix < n and old[prefix] == program[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < n - prefix and old[-1 - suffix] == program[-1 - suffix]:
+            suffix += 1
+        old_region = old[prefix:len(old) - suffix]
+        new_region = program[prefix:len(program) - suffix]
+        if not old_region and not new_region:
+            return self.words
+
+        # Variables keep their addresses only if no first use sits in the edited region
+        old_end = len(old) - suffix
+        if any(prefix <= index < old_end for index in self.first_use.values()):
+            raise _FullRebuild
+
+        old_region_labels = {text[1:-1] for text in old_region if _is_label(text)}
+        new_region_labels = {text[1:-1] for text in new_region if _is_label(text)}
+        if old_region_labels - new_region_labels:
+            raise _FullRebuild
+        for name in new_region_labels - old_region_labels:
+            if name in self.labels or name in self.variables:
+                raise _FullRebuild
+
+        start = _count_instructions(old[:prefix])
+        old_count = _count_instructions(old_region)
+        delta = _count_instructions(new_region) - old_count
+
+        # Labels in the prefix keep their address; the rest are rescanned from `start`
+        labels = {name: address for name, address in self.labels.items()
+                  if name not in old_region_labels}
+        labels.update(self._scan_labels(program, prefix, start))
+        moved = {name for name, address in labels.items() if self.labels.get(name) != address}
+        record_delta = len(new_region) - len(old_region)
+        first_use = {name: index + record_delta if index >= old_end else index
+                     for name, index in self.first_use.items()}
+
+        region_words, region_refs = self._encode(new_region, start, prefix, labels, first_use,
+                                                 allocate=False)
+
+        words = self.words[:start] + region_words + self.words[start + old_count:]
+        cut = bisect_left(self.refs, start, key=lambda ref: ref[0])
+        rest = bisect_left(self.refs, start + old_count, key=lambda ref: ref[0])
+        refs = self.refs[:cut] + region_refs + [(address + delta, name)
+                                                for address, name in self.refs[rest:]]
+        for address, name in refs:
+            if name in moved:
+                words[address] = Code.encode_A(labels[name])
+
+        self.program = program
+        self.words = words
+        self.labels = labels
+        self.first_use = first_use
+        self.refs = refs
+        return words
+
+    @staticmethod
+    def _scan_labels(program: list[str], first: int, address: int) -> dict[str, int]:
+        """Addresses of the labels defined from program[first] on, starting at `address`."""
+        labels = {}
+        for text in program[first:]:
+            if _is_label(text):
+                labels[text[1:-1]] = address
+            else:
+                address += 1
+        return labels
+
+    def _encode(self, records: list[str], address: int, index: int, labels: dict[str, int],
+                first_use: dict[str, int], allocate: bool) -> tuple[array, list[tuple[int, str]]]:
+        """
+        Encode records starting at ROM `address` / program `index`. A variable may only
+        be used after its first use; new ones are only allocated when `allocate` is set.
+        """
+        variables = self.variables
+        words = array("H")
+        refs: list[tuple[int, str]] = []
+        for text in records:
+            if _is_label(text):
+                index += 1
+                continue
+            if text.startswith("@"):
+                symbol = text[1:]
+                if symbol.isdigit():
+                    words.append(Code.encode_A(int(symbol)))
+                elif symbol in labels:
+                    refs.append((address, symbol))
+                    words.append(Code.encode_A(labels[symbol]))
+                elif symbol in symbol_table:
+                    words.append(symbol_table[symbol])
+                elif symbol in variables and first_use[symbol] < index:
+                    words.append(variables[symbol])
+                elif allocate:
+                    variables[symbol] = VARIABLE_BASE + len(variables)
+                    first_use[symbol] = index
+                    words.append(Code.encode_A(variables[symbol]))
+                else:
+                    raise _FullRebuild
+            else:
+                words.append(Code.encode_C(text))
+            address += 1
+            index += 1
+        return words, refs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help="assembly file to read")
+    parser.add_argument("--watch", action="store_true", help="re-assemble whenever the file changes")
+    parser.add_argument("--interval", type=float, default=0.2, help="polling interval in seconds")
+    args = parser.parse_args()
+    output_path = f"{os.path.splitext(args.filepath)[0]}.hack"
+
+    assembler = IncrementalAssembler()
+    last_mtime = None
+    while True:
+        mtime = os.stat(args.filepath).st_mtime_ns
+        if mtime != last_mtime:
+            last_mtime = mtime
+            start = time.perf_counter()
+            try:
+                rom_file.write_text(assembler.assemble_file(args.filepath), output_path)
+                print(f"✅ {output_path} ({time.perf_counter() - start:.3f}s, "
+                      f"{assembler.full_builds} full / {assembler.incremental_builds} incremental)")
+            except ValueError as e:
+                print(f"❌ {args.filepath}: {e}")
+        if not args.watch:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+machine_state.py
+
+Snapshots of a Hack machine (registers, cycle count and all 32K words of RAM, including
+the screen map) in a fixed-layout file, so many runs can be forked from one checkpoint
+instead of replaying the OS init from reset:
+
+    magic "HSTA" | uint16 version | uint16 pc | int16 A | int16 D | uint64 cycles | padding
+    int16 ram[32768]
+
+The header is 32 bytes and all integers are little-endian. Loading memory-maps the file
+copy-on-write, so nothing is parsed: RAM is a view into the mapped pages. Machines copy
+that RAM when they restore a state, so one loaded snapshot can seed any number of runs.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from typing import NamedTuple
+
+import rom_file
+
+STATE_EXT = ".hackstate"
+STATE_VERSION = 1
+RAM_WORDS = 0x8000  # fixed by the layout, whatever the program uses
+_HEADER = struct.Struct("<4sHHhhQ12x")
+_MAGIC = b"HSTA"
+
+
+class MachineState(NamedTuple):
+    pc: int
+    A: int
+    D: int
+    cycles: int
+    ram: array | memoryview
+
+
+def write_state(state: MachineState, output_path: str) -> None:
+    if len(state.ram) != RAM_WORDS:
+        raise ValueError(f"RAM must hold {RAM_WORDS} words, not {len(state.ram)}")
+    ram = array("h", state.ram)
+    if sys.byteorder == "big":
+        ram.byteswap()
+    with rom_file.atomic_write(output_path, "wb") as out_f:
+        out_f.write(_HEADER.pack(_MAGIC, STATE_VERSION, state.pc, state.A, state.D, state.cycles))
+        out_f.write(ram.tobytes())
+
+
+def load_state(input_path: str) -> MachineState:
+    """
+    Memory-map a snapshot. The returned RAM is a writable copy-on-write view: writes
+    stay private to this process and never reach the file.
+    """
+    with open(input_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mapped) != _HEADER.size + 2 * RAM_WORDS:
+        raise ValueError(f"Not a machine state: {input_path}")
+    magic, version, pc, A, D, cycles = _HEADER.unpack_from(mapped, 0)
+    if magic != _MAGIC or version != STATE_VERSION:
+        raise ValueError(f"Not a machine state (version {STATE_VERSION}): {input_path}")
+    if sys.byteorder == "big":
+        ram = array("h")
+        ram.frombytes(mapped[_HEADER.size:])
+        ram.byteswap()
+        mapped.close()
+    else:
+        ram = memoryview(mapped)[_HEADER.size:].cast("h")
+    return MachineState(pc, A, D, cycles, ram)
@@ -0,0 +1,323 @@
+"""
+peephole.py
+
+An optional optimisation pass over the cleaned instruction stream, run before labels
+are resolved. The program is a list of (cleaned_text, source_line) records where
+labels are kept as "(NAME)" records, so any record after a label may be a jump target.
+
+Patterns (applied repeatedly until nothing changes):
+    - fuse:      @X  M=M+1  @X  AM=M-1   ->  @X  A=M    (push immediately undone by a pop)
+    - reload:    @X  <C without A dest>  @X   ->  drops the second @X (A still holds X)
+    - dead load: @X  @Y                   ->  drops @X (A is overwritten before any use)
+    - next jump: @L  <jump without dest>  (L)  ->  drops the jump to the next instruction
+    - thread:    a jump to a label whose code is just @M and a jump without dest (0;JMP)
+                 jumps straight to M (followed through whole goto-to-goto chains)
+    - unreachable: code after an unconditional jump is dropped up to the next label
+                 that is referenced; unreferenced labels inside it go with it
+    - alias:     consecutive labels (same ROM address) collapse into one name
+
+Numeric jump targets (@N immediately followed by a jump, as emitted by the course VM
+translator for its shared routines) are first rewritten to synthetic labels so removing
+code cannot break them; targets past the end of the program land in empty ROM whatever
+is removed, so they stay numeric. Any other number that names a ROM address cannot be relocated:
+a program that loads the address of code reachable only through a computed jump (the
+unlabelled instruction after an unconditional jump that is not a numeric jump target,
+e.g. the `@N D=A` return addresses of PongL.asm) is left unchanged.
+"""
+from dataclasses import dataclass, field
+
+Record = tuple[str, int]
+
+ROM_LABEL = "ROM$"
+
+
+@dataclass
+class PeepholeStats:
+    """Instruction counts before/after optimisation and how often each pattern fired."""
+    before: int = 0
+    after: int = 0
+    patterns: dict[str, int] = field(default_factory=dict)
+    skipped: str = ""  # why the program was left unchanged, if it was
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+    def __str__(self) -> str:
+        if self.skipped:
+            return f"peephole: skipped, {self.skipped}"
+        fired = ", ".join(f"{name}: {count}" for name, count in self.patterns.items() if count)
+        percent = 100 * self.saved / self.before if self.before else 0.0
+        return (f"peephole: {self.before} -> {self.after} instructions "
+                f"({self.saved} ROM words saved, {percent:.1f}%)" + (f" [{fired}]" if fired else ""))
+
+
+def is_label(text: str) -> bool:
+    return text.startswith("(")
+
+
+def split_C(text: str) -> tuple[str, str, str]:
+    """Split a cleaned C-instruction into dest, comp and jump (empty when absent)."""
+    dest, _, rest = text.partition("=") if "=" in text else ("", "", text)
+    comp, _, jump = rest.partition(";")
+    return dest, comp, jump
+
+
+def is_jump(text: str) -> bool:
+    return not text.startswith(("@", "(")) and ";" in text
+
+
+def is_unconditional(text: str) -> bool:
+    return is_jump(text) and text.endswith(";JMP")
+
+
+def count_instructions(program: list[Record]) -> int:
+    return sum(1 for text, _ in program if not is_label(text))
+
+
+def numeric_jump_targets(program: list[Record]) -> set[int]:
+    """
+    The ROM addresses N of every `@N` that is immediately followed by a jump, up to
+    and including the address just past the last instruction.
+    """
+    size = count_instructions(program)
+    targets: set[int] = set()
+    for (text, _), (following, _) in zip(program, program[1:]):
+        if text[1:].isdigit() and text.startswith("@") and is_jump(following) \
+                and int(text[1:]) <= size:
+            targets.add(int(text[1:]))
+    return targets
+
+
+def unrelocatable_value(program: list[Record]) -> str | None:
+    """
+    The first `@N` (not itself a jump) whose N is the ROM address of an unlabelled
+    instruction right after an unconditional jump, other than a numeric jump target.
+    Such code is only reached through an address computed at run time (a return
+    address, a jump table) that no pass can relocate. None when the program is safe.
+    """
+    targets = numeric_jump_targets(program)
+    entries: set[int] = set()
+    address = 0
+    previous = ""
+    labelled = False
+    for text, _ in program:
+        if is_label(text):
+            labelled = True
+            continue
+        if is_unconditional(previous) and not labelled and address not in targets:
+            entries.add(address)
+        previous = text
+        address += 1
+        labelled = False
+    if not entries:
+        return None
+    for i, (text, line) in enumerate(program):
+        if text.startswith("@") and text[1:].isdigit() and int(text[1:]) in entries:
+            following = program[i + 1][0] if i + 1 < len(program) else ""
+            if not is_jump(following):
+                return f"line {line}: {text} is the address of code only reached by a computed jump"
+    return None
+
+
+def symbolize_jump_targets(program: list[Record]) -> list[Record]:
+    """Replace numeric jump targets (@N followed by a jump) with labels placed at ROM address N."""
+    targets = numeric_jump_targets(program)
+    if not targets:
+        return program
+
+    result: list[Record] = []
+    address = 0
+    for i, (text, line) in enumerate(program):
+        if not is_label(text):
+            if address in targets:
+                result.append((f"({ROM_LABEL}{address})", line))
+            address += 1
+            following = program[i + 1][0] if i + 1 < len(program) else ""
+            if text.startswith("@") and text[1:].isdigit() and int(text[1:]) in targets \
+                    and is_jump(following):
+                text = f"@{ROM_LABEL}{text[1:]}"
+        result.append((text, line))
+    if address in targets:
+        result.append((f"({ROM_LABEL}{address})", program[-1][1]))
+    return result
+
+
+def _fuse_push_pop(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    # The reload pattern may already have dropped the second @X, so both forms are matched
+    result: list[Record] = []
+    i = 0
+    while i < len(program):
+        window = [text for text, _ in program[i:i + 4]]
+        if len(window) >= 3 and window[0].startswith("@") and window[1] == "M=M+1":
+            length = 0
+            if window[2] == "AM=M-1":
+                length = 3
+            elif len(window) == 4 and window[2] == window[0] and window[3] == "AM=M-1":
+                length = 4
+            if length:
+                result.append(program[i])
+                result.append(("A=M", program[i + 1][1]))
+                stats.patterns["fuse"] += 1
+                i += length
+                continue
+        result.append(program[i])
+        i += 1
+    return result
+
+
+def _drop_redundant_loads(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    result: list[Record] = []
+    known_A = None  # the @ operand currently held in A, if any
+    for i, (text, line) in enumerate(program):
+        if is_label(text):
+            known_A = None
+        elif text.startswith("@"):
+            following = program[i + 1][0] if i + 1 < len(program) else ""
+            if text == known_A:
+                stats.patterns["reload"] += 1
+                continue
+            if following.startswith("@"):
+                stats.patterns["dead load"] += 1
+                continue
+            known_A = text
+        elif "A" in split_C(text)[0]:
+            known_A = None
+        result.append((text, line))
+    return result
+
+
+def _drop_jumps_to_next(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    result: list[Record] = []
+    i = 0
+    while i < len(program):
+        text = program[i][0]
+        if text.startswith("@") and i + 1 < len(program) and is_jump(program[i + 1][0]) \
+                and not split_C(program[i + 1][0])[0]:
+            following_labels = set()
+            j = i + 2
+            while j < len(program) and is_label(program[j][0]):
+                following_labels.add(program[j][0][1:-1])
+                j += 1
+            if text[1:] in following_labels:
+                stats.patterns["next jump"] += 1
+                i += 2
+                continue
+        result.append(program[i])
+        i += 1
+    return result
+
+
+def _label_targets(program: list[Record]) -> dict[str, int]:
+    """Map each label to the index of the first instruction record after it."""
+    targets: dict[str, int] = {}
+    run: list[str] = []
+    for i, (text, _) in enumerate(program):
+        if is_label(text):
+            run.append(text[1:-1])
+        elif run:
+            targets.update(dict.fromkeys(run, i))
+            run = []
+    targets.update(dict.fromkeys(run, len(program)))
+    return targets
+
+
+def _thread_jumps(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    targets = _label_targets(program)
+
+    def final_target(label: str) -> str:
+        seen = set()
+        while label not in seen:
+            seen.add(label)
+            i = targets[label]
+            if i + 1 >= len(program):
+                break
+            text, following = program[i][0], program[i + 1][0]
+            # A hop that also writes a register (D=D+1;JMP) cannot be skipped
+            if not (text.startswith("@") and text[1:] in targets and is_unconditional(following)
+                    and not split_C(following)[0]):
+                break
+            label = text[1:]
+        return label
+
+    result: list[Record] = []
+    for i, (text, line) in enumerate(program):
+        if text.startswith("@") and text[1:] in targets \
+                and i + 1 < len(program) and is_jump(program[i + 1][0]):
+            target = final_target(text[1:])
+            if target != text[1:]:
+                stats.patterns["thread"] += 1
+                text = f"@{target}"
+        result.append((text, line))
+    return result
+
+
+def _drop_unreachable(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    referenced = {text[1:] for text, _ in program if text.startswith("@")}
+    result: list[Record] = []
+    reachable = True
+    for text, line in program:
+        if is_label(text) and text[1:-1] in referenced:
+            reachable = True
+        if not reachable:
+            if not is_label(text):
+                stats.patterns["unreachable"] += 1
+            continue
+        if is_unconditional(text):
+            reachable = False
+        result.append((text, line))
+    return result
+
+
+def _collapse_aliases(program: list[Record], stats: PeepholeStats) -> list[Record]:
+    # Keep the first real name of each run; synthetic ROM$ labels only if nothing else is there
+    rename: dict[str, str] = {}
+    run: list[str] = []
+    for text, _ in program + [("", 0)]:
+        if is_label(text):
+            run.append(text[1:-1])
+            continue
+        if len(run) > 1:
+            keeper = next((name for name in run if not name.startswith(ROM_LABEL)), run[0])
+            rename.update((name, keeper) for name in run if name != keeper)
+        run = []
+    if not rename:
+        return program
+
+    stats.patterns["alias"] += len(rename)
+    result: list[Record] = []
+    for text, line in program:
+        if is_label(text) and text[1:-1] in rename:
+            continue
+        if text.startswith("@") and text[1:] in rename:
+            text = f"@{rename[text[1:]]}"
+        result.append((text, line))
+    return result
+
+
+PATTERNS = ("fuse", "reload", "dead load", "next jump", "thread", "unreachable", "alias")
+PASSES = (_collapse_aliases, _thread_jumps, _drop_unreachable,
+          _fuse_push_pop, _drop_redundant_loads, _drop_jumps_to_next)
+
+
+def optimize(program: list[Record]) -> tuple[list[Record], PeepholeStats]:
+    """
+    Run every pattern until the program stops shrinking. Programs whose numeric values
+    cannot be relocated (see unrelocatable_value) are returned unchanged, with the
+    reason in stats.skipped.
+    """
+    stats = PeepholeStats(before=count_instructions(program),
+                          patterns={name: 0 for name in PATTERNS})
+    reason = unrelocatable_value(program)
+    if reason is not None:
+        stats.after = stats.before
+        stats.skipped = reason
+        return program, stats
+    program = symbolize_jump_targets(program)
+    size = None
+    while size != len(program):
+        size = len(program)
+        for optimization_pass in PASSES:
+            program = optimization_pass(program, stats)
+    stats.after = count_instructions(program)
+    return program, stats
@@ -0,0 +1,166 @@
+"""
+profiler.py
+
+Opt-in instruction-level profiling for the Hack emulator. `ProfilingMachine` counts
+every executed instruction in an array('Q') indexed by ROM address; with the labels of
+the assembler's source map the counts are summed per label and per VM function
+(`Math.multiply`, `Memory.alloc`, ...).
+
+Call stacks are sampled: every `sample_interval` cycles the VM frame chain is walked
+(LCL points at the current frame, the return address is stored at LCL-5 and the
+caller's LCL at LCL-4) and the cycles since the last sample are charged to that stack,
+in the collapsed format read by flamegraph.pl and speedscope.
+
+Example usage:
+    python3 profiler.py test/pong/Pong.asm --cycles 20000000 --flamegraph pong.folded
+    python3 profiler.py test/pong/Pong.hack --map test/pong/Pong.hackmap --top 30
+"""
+import argparse
+import re
+from array import array
+from collections import Counter
+
+from assembler import Assembler
+from hack_emulator import MEMORY_SIZE, HackMachine, load_program, run_loop_counted
+import rom_file
+from source_map import MAP_EXT, SourceMap
+
+LCL = 1
+MAX_DEPTH = 256
+_FUNCTION_LABEL = re.compile(r"[A-Za-z_]\w*\.[A-Za-z_]\w*")
+_GENERATED_LABEL = re.compile(r"[A-Z]+_")  # RET_ADDRESS_CALL3, LOOP_ball.new, ...
+
+
+def is_function_label(label: str) -> bool:
+    """True for the entry label of a VM function (`Class.method`), not for labels inside one."""
+    return bool(_FUNCTION_LABEL.fullmatch(label)) and not _GENERATED_LABEL.match(label)
+
+
+def function_scopes(source_map: SourceMap) -> list[str]:
+    """
+    The function each ROM address belongs to: the closest function label above it.
+    Code before the first function (bootstrap, shared runtime routines) and programs
+    without VM functions fall back to plain label scopes.
+    """
+    scopes = [source_map.names[index] for index in source_map.labels]
+    current = ""
+    for address, label in enumerate(scopes):
+        if is_function_label(label):
+            current = label
+        scopes[address] = current or label
+    return scopes
+
+
+class ProfilingMachine(HackMachine):
+    """A HackMachine that counts executions per ROM address and samples VM call stacks."""
+
+    def __init__(self, rom, source_map: SourceMap | None = None, sample_interval: int = 10_000):
+        super().__init__(rom)
+        self.counts = array("Q", bytes(8 * MEMORY_SIZE))
+        self.source_map = source_map
+        self.functions = function_scopes(source_map) if source_map is not None else None
+        self.sample_interval = sample_interval
+        self.stacks: Counter[str] = Counter()
+
+    def run(self, max_cycles: int) -> int:
+        remaining = max_cycles
+        while remaining:
+            chunk = min(remaining, self.sample_interval) if self.sample_interval else remaining
+            self._run_counted(chunk)
+            if self.functions is not None:
+                self.stacks[";".join(reversed(self.call_stack()))] += chunk
+            remaining -= chunk
+        return max_cycles
+
+    def _run_counted(self, max_cycles: int) -> None:
+        self.A, self.D, self.pc = run_loop_counted(self.code, self.ram, self.A, self.D, self.pc,
+                                                   max_cycles, self.counts)
+        self.cycles += max_cycles
+
+    def _function_at(self, address: int) -> str:
+        if address < len(self.functions):
+            return self.functions[address] or f"@{address}"
+        return f"@{address}"
+
+    def call_stack(self) -> list[str]:
+        """The current VM call stack, innermost function first."""
+        ram = self.ram
+        stack = [self._function_at(self.pc)]
+        frame = ram[LCL]
+        while 5 <= frame < MEMORY_SIZE and len(stack) < MAX_DEPTH:
+            return_address = ram[frame - 5]
+            if not 0 < return_address <= len(self.rom):
+                break
+            # The call site is the jump just before the return address; the return address
+            # itself may already be the next function's entry (e.g. after `call Sys.init`)
+            stack.append(self._function_at(return_address - 1))
+            caller = ram[frame - 4]
+            if caller >= frame:
+                break
+            frame = caller
+        return stack
+
+    def report(self, top: int = 20) -> str:
+        """Cycles per function, per label and per hot address, most expensive first."""
+        total = sum(self.counts) or 1
+        lines = []
+        if self.source_map is not None:
+            by_function, by_label = Counter(), Counter()
+            names, labels = self.source_map.names, self.source_map.labels
+            for address, count in enumerate(self.counts[:len(self.functions)]):
+                if count:
+                    by_function[self.functions[address]] += count
+                    by_label[names[labels[address]]] += count
+            for title, counter in (("function", by_function), ("label", by_label)):
+                lines.append(f"{'cycles':>12} {'%':>6}  {title}")
+                lines += [f"{count:12d} {100 * count / total:6.2f}  {name or '(none)'}"
+                          for name, count in counter.most_common(top)]
+                lines.append("")
+        lines.append(f"{'cycles':>12} {'%':>6}  address")
+        hot = sorted(range(len(self.rom)), key=self.counts.__getitem__, reverse=True)[:top]
+        for address in hot:
+            where = ""
+            if self.source_map is not None:
+                line, label = self.source_map.lookup(address)
+                where = f"  line {line} ({label})"
+            lines.append(f"{self.counts[address]:12d} {100 * self.counts[address] / total:6.2f}  "
+                         f"{address}{where}")
+        return "\n".join(lines)
+
+    def write_collapsed(self, output_path: str) -> None:
+        """Write the sampled stacks as `outer;inner cycles` lines (flame graph input)."""
+        with open(output_path, "w") as out_f:
+            for stack, cycles in sorted(self.stacks.items()):
+                out_f.write(f"{stack} {cycles}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"program to run (.asm, .hack or {rom_file.PACKED_EXT})")
+    parser.add_argument("--map", help=f"source map ({MAP_EXT}) of a .hack/{rom_file.PACKED_EXT} ROM")
+    parser.add_argument("--cycles", type=int, default=10_000_000, help="instructions to execute")
+    parser.add_argument("--sample-interval", type=int, default=10_000,
+                        help="cycles between call stack samples")
+    parser.add_argument("--top", type=int, default=20, help="rows per report table")
+    parser.add_argument("--flamegraph", help="write collapsed stacks to this file")
+    args = parser.parse_args()
+
+    if args.filepath.endswith(".asm"):
+        assembler = Assembler(track_source=True)
+        words = assembler.assemble_file(args.filepath)
+        source_map = assembler.source_map
+    else:
+        words = load_program(args.filepath)
+        source_map = SourceMap.load(args.map) if args.map else None
+    if args.flamegraph and source_map is None:
+        parser.error("--flamegraph needs label names: pass an .asm file or --map")
+
+    machine = ProfilingMachine(words, source_map, args.sample_interval)
+    machine.run(args.cycles)
+    print(machine.report(args.top))
+    if args.flamegraph:
+        machine.write_collapsed(args.flamegraph)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+rom_file.py
+
+Reading and writing Hack ROM images.
+Two formats are supported:
+    - .hack    textual, one 16-bit binary word per line (the course format)
+    - .hackbin packed, little-endian uint16 words with no header (2 bytes per word)
+"""
+import mmap
+import os
+import sys
+from array import array
+from contextlib import contextmanager
+
+PACKED_EXT = ".hackbin"
+
+
+@contextmanager
+def atomic_write(output_path: str, mode: str):
+    """
+    Write to a temporary file and atomically rename it over output_path.
+    The old file (which may be a hard link into a build cache) is never modified in place.
+    """
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode) as out_f:
+            yield out_f
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_text(words: array, output_path: str) -> None:
+    """Write 16-bit words as the textual .hack format, one binary word per line."""
+    with atomic_write(output_path, "w") as out_f:
+        out_f.writelines(f"{word:016b}\n" for word in words)
+
+
+def write_packed(words: array, output_path: str) -> None:
+    """Write 16-bit words as little-endian uint16 in a single write() call."""
+    if words.typecode != "H":
+        words = array("H", words)
+    if sys.byteorder == "big":
+        words = array("H", words)
+        words.byteswap()
+    with atomic_write(output_path, "wb") as out_f:
+        out_f.write(words.tobytes())
+
+
+def read_text(input_path: str) -> array:
+    """Read a textual .hack file into an array of 16-bit words."""
+    with open(input_path, "r") as f:
+        return array("H", (int(line, 2) for line in f if line.strip()))
+
+
+def read_packed(input_path: str) -> memoryview | array:
+    """
+    Memory-map a packed ROM and return it as a read-only sequence of uint16 words.
+    No parsing is done: the returned memoryview indexes straight into the mapped pages.
+    """
+    if os.path.getsize(input_path) == 0:
+        return array("H")
+    with open(input_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if sys.byteorder == "big":
+        words = array("H")
+        words.frombytes(mapped)
+        words.byteswap()
+        mapped.close()
+        return words
+    return memoryview(mapped).cast("H")
+
+
+def read_rom(input_path: str) -> memoryview | array:
+    """Load a ROM in either format, chosen by file extension."""
+    if input_path.endswith(PACKED_EXT):
+        return read_packed(input_path)
+    return read_text(input_path)
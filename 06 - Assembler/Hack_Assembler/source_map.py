@@ -0,0 +1,108 @@
+"""
+source_map.py
+
+Maps every ROM address back to the source line it was assembled from and to the
+label in scope at that point (the closest label defined above it).
+
+The map is two parallel array('I') columns indexed by ROM address plus a small table
+of label names. On disk (.hackmap) it is laid out so that a loader can memory-map it
+and answer lookups by address without parsing:
+
+    magic "HMAP" | uint32 count | uint32 names_size
+    uint32 lines[count] | uint32 labels[count] | names (utf-8, newline separated)
+
+All integers are little-endian. Label index 0 means "no label in scope".
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+MAP_EXT = ".hackmap"
+LISTING_EXT = ".lst"
+_HEADER = struct.Struct("<4sII")
+_MAGIC = b"HMAP"
+
+
+class SourceMap:
+    """Parallel columns: lines[address] is a 1-based source line, labels[address] a name index."""
+
+    def __init__(self):
+        self.lines: array | memoryview = array("I")
+        self.labels: array | memoryview = array("I")
+        self.names: list[str] = [""]
+        self._name_index: dict[str, int] = {"": 0}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def label_index(self, name: str) -> int:
+        """Return the index of a label name, registering it on first use."""
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def add(self, line: int, label: int) -> None:
+        """Record the next ROM address."""
+        self.lines.append(line)
+        self.labels.append(label)
+
+    def lookup(self, address: int) -> tuple[int, str]:
+        """Return (source line, label in scope) for a ROM address."""
+        return self.lines[address], self.names[self.labels[address]]
+
+    def write(self, output_path: str) -> None:
+        names = "\n".join(self.names).encode()
+        lines, labels = array("I", self.lines), array("I", self.labels)
+        if sys.byteorder == "big":
+            lines.byteswap()
+            labels.byteswap()
+        with open(output_path, "wb") as out_f:
+            out_f.write(_HEADER.pack(_MAGIC, len(lines), len(names)))
+            out_f.write(lines.tobytes())
+            out_f.write(labels.tobytes())
+            out_f.write(names)
+
+    @classmethod
+    def load(cls, input_path: str) -> "SourceMap":
+        """
+        Memory-map a .hackmap file. The columns are views into the mapped pages,
+        so loading costs the same for any program size.
+        """
+        with open(input_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, names_size = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a source map: {input_path}")
+        source_map = cls()
+        view = memoryview(mapped)
+        start = _HEADER.size
+        middle = start + 4 * count
+        end = middle + 4 * count
+        if sys.byteorder == "big":
+            source_map.lines = array("I", view[start:middle].cast("I"))
+            source_map.labels = array("I", view[middle:end].cast("I"))
+            source_map.lines.byteswap()
+            source_map.labels.byteswap()
+        else:
+            source_map.lines = view[start:middle].cast("I")
+            source_map.labels = view[middle:end].cast("I")
+        source_map.names = bytes(view[end:end + names_size]).decode().split("\n")
+        source_map._name_index = {name: i for i, name in enumerate(source_map.names)}
+        return source_map
+
+
+def write_listing(source_path: str, words, source_map: SourceMap, output_path: str) -> None:
+    """
+    Write a human readable listing: ROM address, binary word, source line number,
+    label in scope and the original source text of every instruction.
+    """
+    with open(source_path, "r") as f:
+        source_lines = f.read().splitlines()
+    with open(output_path, "w") as out_f:
+        for address, word in enumerate(words):
+            line, label = source_map.lookup(address)
+            text = source_lines[line - 1].strip()
+            out_f.write(f"{address:5d}  {word:016b}  {line:6d}  {label:<30} {text}\n")
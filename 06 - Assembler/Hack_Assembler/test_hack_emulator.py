@@ -0,0 +1,78 @@
+"""
+test_hack_emulator.py
+
+Checks of the emulator's machine semantics: the 15-bit PC wraps at the end of ROM like the
+hardware, and the basic-block JIT and the batch emulator reach exactly the interpreter's state.
+
+Example usage:
+    python3 -m unittest test_hack_emulator
+"""
+import os
+import tempfile
+import unittest
+
+from batch_emulator import BatchMachine
+from block_jit import JitMachine
+from hack_emulator import MEMORY_SIZE, HackMachine
+from headless import run_headless
+from machine_state import load_state, write_state
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test")
+
+
+class HackMachineTest(unittest.TestCase):
+
+    def test_pc_wraps_past_end_of_rom(self):
+        # Add.asm has no halt loop: it runs into empty ROM (@0) and wraps back to address 0
+        path = os.path.join(TEST_DIR, "add/Add.asm")
+        machine = HackMachine.from_file(path)
+        machine.run(MEMORY_SIZE + 7232)
+        self.assertEqual((machine.pc, machine.cycles, machine.ram[0]), (7232, MEMORY_SIZE + 7232, 5))
+        jit = JitMachine.from_file(path)
+        jit.run(MEMORY_SIZE + 7232)
+        self.assertEqual(jit.state(), machine.state())
+
+    def test_jump_to_negative_address(self):
+        # A=-1 then 0;JMP goes to ROM address 32767 (empty, @0), whose successor is address 0
+        machine = HackMachine([0b1110111010100000, 0b1110101010000111])
+        machine.run(2)
+        self.assertEqual(machine.pc, MEMORY_SIZE - 1)
+        machine.run(1)
+        self.assertEqual((machine.pc, machine.A), (0, 0))
+
+    def test_batch_pc_wraps_like_interpreter(self):
+        path = os.path.join(TEST_DIR, "add/Add.asm")
+        machine = HackMachine.from_file(path)
+        machine.run(MEMORY_SIZE + 100)
+        batch = BatchMachine.from_file(path, instances=2)
+        batch.run(MEMORY_SIZE + 100)
+        for i in range(2):
+            self.assertEqual((batch.pc[i], batch.A[i], batch.D[i]), (machine.pc, machine.A, machine.D))
+            self.assertEqual(batch.ram[i].tobytes(), machine.ram.tobytes())
+
+    def test_headless_run_off_end_of_program(self):
+        # running off the end of a program never halts, so the run stops at the budget
+        path = os.path.join(TEST_DIR, "add/Add.asm")
+        results = [run_headless(machine_type.from_file(path), max_cycles=100_000)
+                   for machine_type in (HackMachine, JitMachine)]
+        self.assertEqual((results[0].cycles, results[0].halted), (100_000, False))
+        self.assertEqual(results[0], results[1])
+
+    def test_restore_mapped_state_twice(self):
+        # running must not write through to the loaded snapshot, so both runs start alike
+        machine = HackMachine.from_file(os.path.join(TEST_DIR, "add/Add.asm"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "add.hackstate")
+            write_state(machine.state(), path)
+            state = load_state(path)
+            runs = []
+            for _ in range(2):
+                machine.restore(state)
+                machine.run(6)
+                runs.append(machine.state())
+            self.assertEqual(runs[0], runs[1])
+            self.assertEqual((runs[0].ram[0], state.ram[0]), (5, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+test_peephole.py
+
+Checks that the peephole pass (peephole.py) never changes what a program does: the
+optimised and unoptimised builds of each program are run in the emulator and must
+halt with the same screen and the same results in RAM.
+
+Example usage:
+    python3 -m unittest test_peephole
+"""
+import os
+import unittest
+
+from assembler import Assembler
+from hack_emulator import HackMachine
+from headless import run_headless
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test")
+PONG_CYCLES = 25_000_000
+
+
+def build(path: str, optimize: bool):
+    return Assembler(optimize=optimize).assemble_file(os.path.join(TEST_DIR, path))
+
+
+class PeepholeTest(unittest.TestCase):
+
+    def assert_same_run(self, path: str, max_cycles: int, ram: dict[int, int] = {},
+                        outputs: tuple[int, ...] = (), check_interval: int = 100_000):
+        """Run both builds from the given RAM values; compare halting, screen and outputs."""
+        results = []
+        for optimize in (False, True):
+            machine = HackMachine(build(path, optimize))
+            for address, value in ram.items():
+                machine.ram[address] = value
+            result = run_headless(machine, max_cycles=max_cycles,
+                                  check_interval=check_interval)
+            results.append((result.halted, result.screen_sha256,
+                            [machine.ram[address] for address in outputs]))
+        self.assertTrue(results[0][0], f"{path} did not halt")
+        self.assertEqual(results[0], results[1])
+
+    def test_small_programs(self):
+        for path in ("max/Max.asm", "max/MaxL.asm"):
+            self.assert_same_run(path, 1_000, {0: 3, 1: 7}, outputs=(2,), check_interval=100)
+        for path in ("rect/Rect.asm", "rect/RectL.asm"):
+            self.assert_same_run(path, 1_000_000, {0: 50})
+
+    def test_thread_keeps_hops_with_side_effects(self):
+        source = "\n".join(["@L1", "0;JMP", "(L1)", "@L2", "D=D+1;JMP", "(L2)",
+                             "@R0", "M=D", "(END)", "@END", "0;JMP"])
+        for optimize in (False, True):
+            machine = HackMachine(Assembler(optimize=optimize).assemble(source))
+            machine.run(100)
+            self.assertEqual(machine.ram[0], 1)
+
+    def test_jump_past_end_stays_numeric(self):
+        # @100 is past the end of the program, so it must not become a ROM$ label (a variable)
+        source = "\n".join(["@R0", "D=M", "@100", "D;JEQ", "@R1", "M=1", "@R1", "M=1",
+                             "(END)", "@END", "0;JMP"])
+        words = Assembler(optimize=True).assemble(source)
+        self.assertIn(100, words)
+        self.assertEqual(len(words), 9)
+
+    def test_stats_count_source_labels_only(self):
+        # MaxL.asm jumps to numeric addresses: the ROM$N labels they become are not counted
+        for path, labels in (("max/MaxL.asm", 0), ("max/Max.asm", 3)):
+            assembler = Assembler(optimize=True, collect_stats=True)
+            assembler.assemble_file(os.path.join(TEST_DIR, path))
+            self.assertEqual(assembler.stats.labels, labels)
+
+    def test_pong(self):
+        self.assert_same_run("pong/Pong.asm", PONG_CYCLES)
+
+    def test_pong_numeric_addresses(self):
+        # PongL.asm loads return addresses as numbers, so it must not be rewritten
+        assembler = Assembler(optimize=True)
+        words = assembler.assemble_file(os.path.join(TEST_DIR, "pong/PongL.asm"))
+        self.assertTrue(assembler.peephole_stats.skipped)
+        self.assertEqual(words, build("pong/PongL.asm", optimize=False))
+        self.assert_same_run("pong/PongL.asm", PONG_CYCLES)
+
+
+if __name__ == "__main__":
+    unittest.main()
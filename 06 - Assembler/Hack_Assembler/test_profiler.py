@@ -0,0 +1,35 @@
+"""
+test_profiler.py
+
+Checks that profiling does not change execution: ProfilingMachine must reach exactly the
+state of HackMachine, and its per-address counts must add up to the cycles executed.
+
+Example usage:
+    python3 -m unittest test_profiler
+"""
+import os
+import unittest
+
+from assembler import Assembler
+from hack_emulator import HackMachine
+from profiler import ProfilingMachine
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test")
+CYCLES = 2_000_000
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_same_state_as_hack_machine(self):
+        assembler = Assembler(track_source=True)
+        words = assembler.assemble_file(os.path.join(TEST_DIR, "pong/Pong.asm"))
+        reference = HackMachine(words)
+        reference.run(CYCLES)
+        profiled = ProfilingMachine(words, assembler.source_map, sample_interval=10_000)
+        profiled.run(CYCLES)
+        self.assertEqual(profiled.state(), reference.state())
+        self.assertEqual(sum(profiled.counts), CYCLES)
+
+
+if __name__ == "__main__":
+    unittest.main()
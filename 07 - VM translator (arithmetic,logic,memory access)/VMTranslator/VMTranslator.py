@@ -18,17 +18,14 @@ def main():
     filepath = args.filepath
     output_filepath = filepath.replace(".vm", ".asm")
     writer = CodeWriter(output_filepath)
-    vm_parser = Parser(filepath)
-    while vm_parser.has_more_commands():
-        vm_parser.advance()
-        cmd_type = vm_parser.command_type()
-        match cmd_type:
+    for command in Parser(filepath):
+        match command.type:
             case CMDType.C_ARITHMETIC:
-                writer.write_arithmetic(vm_parser.keyword)
+                writer.write_arithmetic(command.arg1)
             case CMDType.C_PUSH | CMDType.C_POP:
-                writer.write_push_pop(cmd_type, vm_parser.arg1(), vm_parser.arg2())
+                writer.write_push_pop(command.type, command.arg1, command.arg2)
             case _:
-                raise ValueError(f"Unknown command type: {cmd_type}")
+                raise ValueError(f"Unknown command type: {command.type}")
 
     writer.close()
     print(f"✅ Translated {filepath} successfully.")
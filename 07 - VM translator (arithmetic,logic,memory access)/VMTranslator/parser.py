@@ -1,4 +1,13 @@
+"""
+parser.py
+
+Streams VM commands from a file. Each line is tokenized and classified once into a
+`Command` record (type, arg1, arg2), so memory use does not grow with the size of the .vm file.
+"""
+
+from collections.abc import Iterator
 from enum import Enum
+from typing import NamedTuple
 
 
 class CMDType(Enum):
@@ -9,67 +18,49 @@ class CMDType(Enum):
     C_POP = "C_POP"
 
 
+ARITHMETIC_COMMANDS = {"add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"}
+
+# keyword -> (command type, number of tokens)
+COMMAND_MAP = {
+    "push": (CMDType.C_PUSH, 3),
+    "pop": (CMDType.C_POP, 3),
+    **{op: (CMDType.C_ARITHMETIC, 1) for op in ARITHMETIC_COMMANDS},
+}
+
+
+class Command(NamedTuple):
+    """A classified VM command. For arithmetic commands arg1 is the operation itself."""
+
+    type: CMDType
+    arg1: str = ""
+    arg2: int = 0
+
+
+def parse_line(line: str) -> Command | None:
+    """Tokenize and classify one line; return None for blank and comment lines."""
+    tokens = line.split("//", 1)[0].split()
+    if not tokens:
+        return None
+    keyword = tokens[0]
+    cmd_type, n_tokens = COMMAND_MAP.get(keyword, (None, 0))
+    if len(tokens) != n_tokens:
+        raise ValueError(f"Unknown command type: {' '.join(tokens)}")
+    match n_tokens:
+        case 1:
+            return Command(cmd_type, keyword)
+        case _:
+            return Command(cmd_type, tokens[1], int(tokens[2]))
+
+
 class Parser:
-    """A class to parse VM commands from a file."""
+    """A class to parse VM commands from a file; iterating yields `Command` records."""
 
     def __init__(self, filepath: str):
-        self.instruction_index = 0
-        self.instructions: list[str] = []
-        with open(filepath, "r") as f:
+        self.filepath = filepath
+
+    def __iter__(self) -> Iterator[Command]:
+        with open(self.filepath, "r") as f:
             for line in f:
-                cleaned_line = line.split("//")[0].strip()
-                if cleaned_line:
-                    self.instructions.append(cleaned_line)
-        self.n_instructions = len(self.instructions)
-        self.instruction: str = ""
-        self.tokens: list[str] = []
-        self.keyword: str = ""
-
-    def has_more_commands(self) -> bool:
-        """Checks if there are more commands to parse."""
-        return self.instruction_index < self.n_instructions
-
-    def advance(self) -> bool:
-        """Advances to the next command in the instruction list."""
-        if self.has_more_commands():
-            self.instruction = self.instructions[self.instruction_index]
-            self.instruction_index += 1
-            self.tokens = self.instruction.split()
-            self.keyword = self.tokens[0]
-            return True
-        return False
-
-    def command_type(self) -> CMDType:
-        """Determines the type of the current command."""
-
-        match (len(self.tokens), self.keyword):
-            case (1, self.keyword) if self.keyword in {
-                "add",
-                "sub",
-                "neg",
-                "eq",
-                "gt",
-                "lt",
-                "and",
-                "or",
-                "not",
-            }:
-                return CMDType.C_ARITHMETIC
-            case (3, "push"):
-                return CMDType.C_PUSH
-            case (3, "pop"):
-                return CMDType.C_POP
-            case _:
-                raise ValueError(f"Unknown command type: {self.instruction}")
-
-    def arg1(self) -> str:
-        """Return the first argument of the current command."""
-        if len(self.tokens) > 1:
-            return self.tokens[1]
-        raise ValueError("No first argument found.")
-
-    def arg2(self) -> int:
-        """Return the second argument of the current command."""
-        if len(self.tokens) > 2:
-            return int(self.tokens[2])
-        raise ValueError("No second argument found.")
+                command = parse_line(line)
+                if command is not None:
+                    yield command
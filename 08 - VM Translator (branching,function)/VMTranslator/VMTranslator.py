@@ -1,56 +1,68 @@
 '''VMTranslator.py
 This script translates VM commands into Hack assembly code.
-It uses the Parser class to read VM commands and the CodeWriter class to write the corresponding assembly code.
-It takes a VM file as input and generates an assembly file with the same name but with a .asm extension.
+It uses the Parser class to read VM commands into a compact VMProgram (see vm_ir.py) and the CodeWriter class to write the corresponding assembly code.
+It takes a VM file (or directory, or .vmir program) as input and generates an assembly file with the same name but with a .asm extension.
 
 Example usage:
     python3 VMTranslator.py test/FunctionCalls/FibonacciElement/Main.vm
+    python3 VMTranslator.py test/FunctionCalls/FibonacciElement --ir
+    python3 VMTranslator.py test/FunctionCalls/NestedCall --shared-calls
 
 '''
 
 
 import argparse
-from parser import Parser, CMD
+from parser import Parser
 from codewriter import CodeWriter
+from vm_ir import IR_EXT, Op, Segment, VMProgram
 import os
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("filepath", help="vm file to read")
+    parser.add_argument("filepath", help=f"vm file, directory or {IR_EXT} program to read")
+    parser.add_argument("--ir", action="store_true", help=f"also write the program as compact IR ({IR_EXT})")
+    parser.add_argument("--shared-calls", action="store_true",
+                        help="jump to one shared call/return routine instead of inlining them (smaller ROM)")
     args = parser.parse_args()
     filepath: str = args.filepath
-    if filepath.endswith(".vm"):
-        output_filepath = filepath.replace(".vm", ".asm")
-        filepath = os.path.dirname(filepath)
+    if filepath.endswith(IR_EXT):
+        output_filepath = filepath.replace(IR_EXT, ".asm")
+        program = VMProgram.load(filepath)
     else:
-        output_filepath = filepath + "/Sys.asm"
-    writer = CodeWriter(output_filepath)
-    for f in os.listdir(filepath):
-        if f.endswith(".vm"):
-            vm_parser = Parser(os.path.join(filepath, f))
-            writer.set_file_name(file_name=os.path.splitext(f)[0])
-            while vm_parser.has_more_commands():
-                vm_parser.advance()
-                cmd_type = vm_parser.command_type()
-                match cmd_type:
-                    case CMD.ARITHMETIC:
-                        writer.write_arithmetic(vm_parser.keyword)
-                    case CMD.PUSH | CMD.POP:
-                        writer.write_push_pop(cmd_type, vm_parser.arg1(), vm_parser.arg2())
-                    case CMD.LABEL:
-                        writer.write_label(vm_parser.arg1())
-                    case CMD.GOTO:
-                        writer.write_goto(vm_parser.arg1())
-                    case CMD.IF_GOTO:
-                        writer.write_if(vm_parser.arg1())
-                    case CMD.FUNCTION:
-                        writer.write_function(vm_parser.arg1(), vm_parser.arg2())
-                    case CMD.RETURN:
-                        writer.write_return()
-                    case CMD.CALL:
-                        writer.write_call(vm_parser.arg1(), vm_parser.arg2())
-                    case _:
-                        raise ValueError(f"Unknown command type: {cmd_type}")
+        if filepath.endswith(".vm"):
+            output_filepath = filepath.replace(".vm", ".asm")
+            filepath = os.path.dirname(filepath)
+        else:
+            output_filepath = filepath + "/Sys.asm"
+        program = VMProgram()
+        for f in os.listdir(filepath):
+            if f.endswith(".vm"):
+                program.add_file(os.path.splitext(f)[0], Parser(os.path.join(filepath, f)))
+        if args.ir:
+            program.write(os.path.splitext(output_filepath)[0] + IR_EXT)
+    writer = CodeWriter(output_filepath, shared_calls=args.shared_calls)
+    names = program.names
+    # Dispatch straight on the integer-coded IR: no Command records, no strings to match
+    for op, a, b in program:
+        match op:
+            case Op.FILE:
+                writer.set_file_name(file_name=names[a])
+            case Op.PUSH | Op.POP:
+                writer.write_push_pop(op, Segment(a), b)
+            case Op.LABEL:
+                writer.write_label(names[a])
+            case Op.GOTO:
+                writer.write_goto(names[a])
+            case Op.IF_GOTO:
+                writer.write_if(names[a])
+            case Op.FUNCTION:
+                writer.write_function(names[a], b)
+            case Op.CALL:
+                writer.write_call(names[a], b)
+            case Op.RETURN:
+                writer.write_return()
+            case _:
+                writer.write_arithmetic(op)
 
     writer.close()
     print(f"✅ Translated {filepath} successfully.")
@@ -2,27 +2,52 @@
 CodeWriter class for translating VM commands to Hack assembly code.
 This class handles arithmetic operations, memory access commands, and manages the output file.
 It provides methods to write arithmetic operations, push and pop commands, and finalize the assembly code
+Commands arrive as the integer-coded Op/Segment values of the VM IR (see vm_ir.py), so nothing is
+re-parsed from text. The assembly of each (op, arg1, arg2) is built once and kept in a bounded cache; labels that must be
+unique per use (comparisons, return addresses) are left as a {0} placeholder filled in on every write.
+Output is collected in memory and written to the file in large chunks.
+
+With shared_calls=True every call site only loads the target, nArgs and return address into
+R13-R15 and jumps to one global call routine, and every return jumps to one global return
+routine. eq/gt/lt likewise load their return address into R15 and jump to one routine per
+comparison. The routines are written once at the end of the file; this trades a few cycles per
+call for a much smaller ROM.
 """
 import os
-from parser import CMD,OPERATION_MAP
+from functools import lru_cache
+from parser import OPERATION_MAP
+from vm_ir import Op, Segment
 
 TEMP_BASE = 5
 WORK_REG = "R13"
 FRAME_REG = "R14"
 RET_REG = "R15"
-
-SEGMENT_MAP = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+CALL_TARGET_REG = "R13"
+CALL_ARGS_REG = "R14"
+CALL_RETURN_REG = "R15"
+CALL_ROUTINE = "VM$CALL"
+RETURN_ROUTINE = "VM$RETURN"
+COMPARE_RETURN_REG = "R15"
+
+SEGMENT_MAP = {Segment.LOCAL: "LCL", Segment.ARGUMENT: "ARG", Segment.THIS: "THIS", Segment.THAT: "THAT"}
+COMPARE_OPS = {Op.EQ, Op.GT, Op.LT}
+FRAGMENT_CACHE_SIZE = 4096
+FLUSH_SIZE = 1 << 16  # characters buffered before a write
 
 class CodeWriter:
     """A class to write Hack assembly code from VM commands."""
     
-    def __init__(self, output_filepath: str):
+    def __init__(self, output_filepath: str, shared_calls: bool = False):
         full_file_name = os.path.basename(output_filepath)
         self.file_name = os.path.splitext(full_file_name)[0]
         self.file = open(output_filepath, "w")
+        self.chunks: list[str] = []
+        self.buffered = 0
         self.bool_counter = 0
         self.return_counter = 0
-        self.file.write("// Assembly code " + full_file_name + "\n")
+        self.shared_calls = shared_calls
+        self._fragment = lru_cache(maxsize=FRAGMENT_CACHE_SIZE)(self._fragment_code)
+        self._emit("// Assembly code " + full_file_name + "\n")
         if self.file_name == "Sys":
             self.write_init()
 
@@ -32,7 +57,7 @@ class CodeWriter:
         This is used for static segment handling.
         """
         self.file_name = file_name
-        self.file.write("\n// Translated from " + file_name + ".vm\n")
+        self._emit("\n// Translated from " + file_name + ".vm\n")
 
     def write_init(self):
         """
@@ -43,107 +68,119 @@ class CodeWriter:
 {self._load_symbolA(256)}  // Set SP to 256
 {self._storeD("SP")}  // SP = 256
 '''
-        self.file.write(vm_code)
+        self._emit(vm_code)
         self.write_call(function_name="Sys.init", num_args=0)
 
-    def write_arithmetic(self, op: str) -> None:
+    def write_arithmetic(self, op: Op) -> None:
         """
         Translates the given arithmetic VM command into Hack assembly and writes to file.
         """
-        match op:
-            case "add"| "sub"| "and" | "or":
-                assembly_code = self._arithmetic_operation2(op)
-            case "neg" | "not":
-                assembly_code = self._arithmetic_operation1(op)
-            case "eq"| "gt" | "lt":
-                assembly_code = self._arithmetic_compare(op)
-            case _:
-                raise ValueError(f"Unknown arithmetic command: {op}")
-        self.file.write("\n" + assembly_code + "\n")
+        assembly_code = self._fragment(op)
+        if op in COMPARE_OPS:
+            assembly_code = assembly_code.format(self.bool_counter)
+            self.bool_counter += 1
+        self._emit(assembly_code)
 
 
-    def write_push_pop(self, cmd: CMD, segment: str, index: int) -> None:
+    def write_push_pop(self, op: Op, segment: Segment, index: int) -> None:
         """
         Translates the given push or pop VM command into Hack assembly and writes to file.
         """
-        if cmd == CMD.PUSH:
-            assembly_code = self._push(segment=segment, index=index)
-        elif cmd == CMD.POP:
-            assembly_code = self._pop(segment=segment, index=index)
-        else:
-            raise ValueError(f"Unknown command: {cmd}")
-        self.file.write("\n" + assembly_code + "\n")
+        # Only static variables depend on the file being translated
+        file_name = self.file_name if segment == Segment.STATIC else ""
+        self._emit(self._fragment(op, segment, index, file_name))
 
     def write_label(self, label: str) -> None:
         """
         Translates the label VM command into Hack assembly and writes to file.
         """
-        self.file.write("\n" + self._label(label) + "\n")    
+        self._emit(self._fragment(Op.LABEL, label))
 
     def write_goto(self, label: str) -> None:
         """
         Translates the goto VM command into Hack assembly and writes to file.
         """
-        self.file.write("\n" + self._goto(label) + "\n")
+        self._emit(self._fragment(Op.GOTO, label))
 
     def write_if(self, label: str) -> None:
         """Translates the if-goto VM command into Hack assembly and writes to file.
         """
-        self.file.write("\n" + self._if_goto(label) + "\n")  
+        self._emit(self._fragment(Op.IF_GOTO, label))
 
     def write_function(self, function_name: str, num_locals: int) -> None:
         """
         Translates the given function VM command into Hack assembly and writes to file.
         Initializes local variables to 0.
         """
-        assembly_code = f'// function {function_name} {num_locals}\n'
-        assembly_code += f'({function_name})\n'
-        push0='D=0\n' + f'{self._push_fromD()}\n'
-        assembly_code += num_locals*push0
-        self.file.write("\n" + assembly_code)
+        self._emit(self._fragment(Op.FUNCTION, function_name, num_locals))
 
     def write_call(self, function_name: str, num_args: int) -> None:
         """
         Translates the given call VM command into Hack assembly and writes to file.
         """
-        return_label = f'return_{function_name}$ret.{self.return_counter}'
+        self._emit(self._fragment(Op.CALL, function_name, num_args).format(self.return_counter))
         self.return_counter += 1
-        assembly_code = f'''// call {function_name} {num_args}
-{self._push_label(return_label)} 
-{self._push_from_reg("LCL")} 
-{self._push_from_reg("ARG")} 
-{self._push_from_reg("THIS")} 
-{self._push_from_reg("THAT")} 
-{self._reposition_ARG(num_args)}
-{self._reposition_LCL()}
-{self._goto(label=function_name)}
-({return_label})'''
-        
-        self.file.write("\n" + assembly_code + "\n")
 
     def write_return(self) -> None:
         """
         Translates the return VM command into Hack assembly and writes to file.
         It restores the caller's state and returns control to the caller.
         """
-        assembly_code = f'''// return
-{self._load_reg_value(reg="LCL")}
-{self._storeD(reg=FRAME_REG)}
-{self._compute_return_address()}
-{self._storeD(RET_REG)}            // R15 = RET
-{self._pop(segment="argument")}
-{self._reposition_SP()}
-{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="THAT")}
-{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="THIS")}
-{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="ARG")}
-{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="LCL")}
-{self._goto_at_ptr(address_reg=RET_REG)}'''
-        self.file.write("\n" + assembly_code + "\n")
-        
+        self._emit(self._fragment(Op.RETURN))
+
     def close(self):
-        '''Close the output file.'''
+        '''Write the shared call/return routines if needed, flush the buffered code and close the output file.'''
+        if self.shared_calls:
+            routines = [self._call_routine(), self._return_routine()]
+            routines += [self._compare_routine(op) for op in sorted(COMPARE_OPS)]
+            self._emit("\n" + "\n\n".join(routines) + "\n")
+        self._flush()
         self.file.close()
 
+# --- Output helpers ---
+    def _emit(self, assembly_code: str) -> None:
+        self.chunks.append(assembly_code)
+        self.buffered += len(assembly_code)
+        if self.buffered >= FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.file.write("".join(self.chunks))
+        self.chunks.clear()
+        self.buffered = 0
+
+    def _fragment_code(self, op: Op, arg1: Segment | str = "", arg2: int = 0, file_name: str = "") -> str:
+        """
+        The assembly of one command, as written to the file. Called through the
+        self._fragment cache; file_name is only part of the key for static segments.
+        """
+        match op:
+            case Op.ADD | Op.SUB | Op.AND | Op.OR:
+                assembly_code = self._arithmetic_operation2(op)
+            case Op.NEG | Op.NOT:
+                assembly_code = self._arithmetic_operation1(op)
+            case Op.EQ | Op.GT | Op.LT:
+                assembly_code = self._arithmetic_compare(op, label_id="{0}")
+            case Op.PUSH:
+                assembly_code = self._push(segment=arg1, index=arg2)
+            case Op.POP:
+                assembly_code = self._pop(segment=arg1, index=arg2)
+            case Op.LABEL:
+                assembly_code = self._label(arg1)
+            case Op.GOTO:
+                assembly_code = self._goto(arg1)
+            case Op.IF_GOTO:
+                assembly_code = self._if_goto(arg1)
+            case Op.FUNCTION:
+                return "\n" + self._function(arg1, arg2)
+            case Op.CALL:
+                assembly_code = self._call(arg1, arg2, return_id="{0}")
+            case Op.RETURN:
+                assembly_code = self._return()
+            case _:
+                raise ValueError(f"Unknown command: {op}")
+        return "\n" + assembly_code + "\n"
+
 # --- Stack helpers ---
     def _point_last(self) -> str:
         return f'''// get value from stack
@@ -198,42 +235,63 @@ M=D'''
 M=D'''
     
 # --- Arithmetic helpers ---
-    def _arithmetic_compare(self, op: str) -> str:
+    def _arithmetic_compare(self, op: Op, label_id: str) -> str:
         # eq, gt, lt
-        compare_asm = f'''// {op}
-{self._pop_toD()}
+        if self.shared_calls:
+            return_label = f'{op.name}_RETURN.{label_id}'
+            return f'''// {op.keyword}
+{self._load_symbolA(return_label)}
+{self._storeD(reg=COMPARE_RETURN_REG)}
+{self._goto(label=self._compare_routine_label(op))}
+({return_label})'''
+        return f'''// {op.keyword}
+{self._compare(op, true_label=f'TRUE.{label_id}', end_label=f'END.{label_id}')}'''
+
+    def _compare(self, op: Op, true_label: str, end_label: str) -> str:
+        return f'''{self._pop_toD()}
 {self._point_last()}
 D=M-D
-@TRUE.{self.bool_counter}
-D;{OPERATION_MAP[op]}
+@{true_label}
+D;{OPERATION_MAP[op.keyword]}
 @SP
 A=M
 M=0
-@END.{self.bool_counter}
+@{end_label}
 0;JMP
-(TRUE.{self.bool_counter})
+({true_label})
 @SP
 A=M
 M=-1
-(END.{self.bool_counter})
+({end_label})
 {self._increment()}'''
-        self.bool_counter += 1
-        return compare_asm
 
-    def _arithmetic_operation1(self, op: str) -> str:
+    def _compare_routine_label(self, op: Op) -> str:
+        return f'VM${op.name}'
+
+    def _compare_routine(self, op: Op) -> str:
+        """
+        The shared body of one comparison; the return address is in R15.
+        """
+        label = self._compare_routine_label(op)
+        return f'''// shared {op.keyword} routine
+({label})
+{self._compare(op, true_label=f'{label}.TRUE', end_label=f'{label}.END')}
+{self._goto_at_ptr(address_reg=COMPARE_RETURN_REG)}'''
+
+    def _arithmetic_operation1(self, op: Op) -> str:
         # neg, not
-        return f'''// {op}
+        return f'''// {op.keyword}
 {self._point_last()}
-M={OPERATION_MAP[op]}M
+M={OPERATION_MAP[op.keyword]}M
 {self._increment()}'''
 
-    def _arithmetic_operation2(self, op: str) -> str:
-        if op == "sub":
+    def _arithmetic_operation2(self, op: Op) -> str:
+        if op == Op.SUB:
             operation = "M-D"
         else:
-            operation = f"D{OPERATION_MAP[op]}M"
+            operation = f"D{OPERATION_MAP[op.keyword]}M"
         # add, sub, and, or
-        return f'''// {op}
+        return f'''// {op.keyword}
 {self._pop_toD()}
 {self._point_last()}
 M={operation}
@@ -241,24 +299,24 @@ M={operation}
 
 
 # --- Memory helpers ---
-    def _pointer_segment(self, index: int) -> str:
+    def _pointer_segment(self, index: int) -> Segment:
         if index == 0:
-            segment = 'this'
+            segment = Segment.THIS
         elif index == 1:
-            segment = 'that'
+            segment = Segment.THAT
         else:
             raise ValueError(f"Invalid pointer index: {index}")
         return segment
 
-    def _pop(self, segment: str, index: int = 0, temp_reg: str = WORK_REG) -> str:
-        comment = f'// pop {segment} {index}'
+    def _pop(self, segment: Segment, index: int = 0, temp_reg: str = WORK_REG) -> str:
+        comment = f'// pop {segment.keyword} {index}'
         match segment:
-            case "local" | "argument" | "this" | "that":
+            case Segment.LOCAL | Segment.ARGUMENT | Segment.THIS | Segment.THAT:
                 assembly_code = f'{comment}\n'
                 if index == 0:
                     temp_reg = SEGMENT_MAP[segment]
                 else:
-                    assembly_code += f'''// get address of {segment} {index}
+                    assembly_code += f'''// get address of {segment.keyword} {index}
 {self._load_reg_value(reg=SEGMENT_MAP[segment])}
 {self._calculate_address(index=index)}
 {self._storeD(reg=temp_reg)}
@@ -267,17 +325,17 @@ M={operation}
 {self._pop_toD()}
 {self._storeD_at_ptr(address_reg=temp_reg)}'''
                 return assembly_code
-            case "constant":
+            case Segment.CONSTANT:
                 raise ValueError("Cannot pop to constant segment")
-            case "static":
+            case Segment.STATIC:
                 return f'''{comment}
 {self._pop_toD()}
 {self._storeD(reg=f'{self.file_name}.{index}')}'''
-            case "temp":
+            case Segment.TEMP:
                 return f'''{comment}
 {self._pop_toD()}
 {self._storeD(reg=f'{TEMP_BASE + index}')}'''
-            case "pointer":
+            case Segment.POINTER:
                 segment_ptr = self._pointer_segment(index)
                 return f'''{comment}
 {self._pop_toD()}
@@ -285,29 +343,29 @@ M={operation}
             case _:
                 raise ValueError(f"Unknown segment: {segment}")
 
-    def _push(self, segment: str, index: int) -> str:
-        comment = f'// push {segment} {index}'
+    def _push(self, segment: Segment, index: int) -> str:
+        comment = f'// push {segment.keyword} {index}'
         match segment:
-            case "local" | "argument" | "this" | "that":
+            case Segment.LOCAL | Segment.ARGUMENT | Segment.THIS | Segment.THAT:
                 return f'''{comment}
 {self._load_reg_value(reg=SEGMENT_MAP[segment])}
 {self._calculate_address(index=index)}
 A=D
 D=M
 {self._push_fromD()}'''
-            case "constant":
+            case Segment.CONSTANT:
                 return f'''{comment}
 {self._load_symbolA(index)}
 {self._push_fromD()}'''
-            case "static":
+            case Segment.STATIC:
                 return f'''{comment}
 {self._load_reg_value(reg=f'{self.file_name}.{index}')}
 {self._push_fromD()}'''
-            case "temp":
+            case Segment.TEMP:
                 return f'''{comment}
 {self._load_reg_value(reg=f'{TEMP_BASE + index}')}
 {self._push_fromD()}'''
-            case "pointer":
+            case Segment.POINTER:
                 segment_ptr = self._pointer_segment(index)
                 return f'''{comment}
 {self._load_reg_value(reg=f'{SEGMENT_MAP[segment_ptr]}')}
@@ -341,6 +399,90 @@ D=M
 D;JNE'''    
 
 # --- function helpers ---
+    def _function(self, function_name: str, num_locals: int) -> str:
+        assembly_code = f'// function {function_name} {num_locals}\n'
+        assembly_code += f'({function_name})\n'
+        push0='D=0\n' + f'{self._push_fromD()}\n'
+        assembly_code += num_locals*push0
+        return assembly_code
+
+    def _call(self, function_name: str, num_args: int, return_id: str) -> str:
+        return_label = f'return_{function_name}$ret.{return_id}'
+        if self.shared_calls:
+            return f'''// call {function_name} {num_args}
+{self._load_symbolA(function_name)}
+{self._storeD(reg=CALL_TARGET_REG)}
+{self._load_symbolA(num_args)}
+{self._storeD(reg=CALL_ARGS_REG)}
+{self._load_symbolA(return_label)}
+{self._storeD(reg=CALL_RETURN_REG)}
+{self._goto(label=CALL_ROUTINE)}
+({return_label})'''
+        assembly_code = f'''// call {function_name} {num_args}
+{self._push_label(return_label)} 
+{self._push_from_reg("LCL")} 
+{self._push_from_reg("ARG")} 
+{self._push_from_reg("THIS")} 
+{self._push_from_reg("THAT")} 
+{self._reposition_ARG(num_args)}
+{self._reposition_LCL()}
+{self._goto(label=function_name)}
+({return_label})'''
+        return assembly_code
+
+    def _return(self) -> str:
+        if self.shared_calls:
+            return f'''// return
+{self._goto(label=RETURN_ROUTINE)}'''
+        return f'''// return
+{self._restore_frame()}'''
+
+    def _restore_frame(self) -> str:
+        """
+        Pop the return value into ARG[0], restore the caller's frame and jump back.
+        """
+        return f'''{self._load_reg_value(reg="LCL")}
+{self._storeD(reg=FRAME_REG)}
+{self._compute_return_address()}
+{self._storeD(RET_REG)}            // R15 = RET
+{self._pop(segment=Segment.ARGUMENT)}
+{self._reposition_SP()}
+{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="THAT")}
+{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="THIS")}
+{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="ARG")}
+{self._restore_from_frame(frame_reg=FRAME_REG,store_reg="LCL")}
+{self._goto_at_ptr(address_reg=RET_REG)}'''
+
+    def _call_routine(self) -> str:
+        """
+        The shared body of every call: saves the caller's frame and jumps to the callee,
+        with the target in R13, nArgs in R14 and the return address in R15.
+        """
+        return f'''// shared call routine
+({CALL_ROUTINE})
+{self._push_from_reg(CALL_RETURN_REG)}
+{self._push_from_reg("LCL")}
+{self._push_from_reg("ARG")}
+{self._push_from_reg("THIS")}
+{self._push_from_reg("THAT")}
+// update ARG after call
+{self._load_reg_value("SP")}
+@5
+D=D-A
+@{CALL_ARGS_REG}
+D=D-M
+{self._storeD(reg="ARG")}
+{self._reposition_LCL()}
+{self._goto_at_ptr(address_reg=CALL_TARGET_REG)}'''
+
+    def _return_routine(self) -> str:
+        """
+        The shared body of every return.
+        """
+        return f'''// shared return routine
+({RETURN_ROUTINE})
+{self._restore_frame()}'''
+
     def _goto_at_ptr(self, address_reg: str) -> str:
         """
         Get the address stored in the given register and jump to it.
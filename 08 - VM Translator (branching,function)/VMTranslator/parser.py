@@ -1,10 +1,14 @@
 """
 parser.py
 
-This module provides the `Parser` class for parsing VM commands and the `CMDType` class for command types.
+This module provides the `Parser` class for parsing VM commands and the `CMD` class for command types.
+The file is streamed line by line: each command is tokenized and classified once into a
+`Command` record (type, arg1, arg2), so memory use does not grow with the size of the .vm file.
 """
 
+from collections.abc import Iterator
 from enum import Enum
+from typing import NamedTuple
 
 class CMD(Enum):
     """Enum class to represent different command types."""
@@ -30,71 +34,57 @@ OPERATION_MAP = {
         "not": "!"
     }
 
-class Parser:
-    """
-    A class to parse VM commands from a file.
-    """
+# keyword -> (command type, number of tokens)
+COMMAND_MAP = {
+        "push": (CMD.PUSH, 3),
+        "pop": (CMD.POP, 3),
+        "label": (CMD.LABEL, 2),
+        "goto": (CMD.GOTO, 2),
+        "if-goto": (CMD.IF_GOTO, 2),
+        "function": (CMD.FUNCTION, 3),
+        "call": (CMD.CALL, 3),
+        "return": (CMD.RETURN, 1),
+        **{op: (CMD.ARITHMETIC, 1) for op in OPERATION_MAP},
+    }
 
-    def __init__(self, filepath: str):
-        self.instruction_index = 0
-        self.instructions: list[str] = []
-        with open(filepath, "r") as f:
-            for line in f:
-                cleaned_line = line.split("//")[0].strip()
-                if cleaned_line:
-                    self.instructions.append(cleaned_line)
-        self.n_instructions = len(self.instructions)
-        self.instruction: str = ""
-        self.tokens: list[str] = []
-        self.keyword: str = ""
 
-    def has_more_commands(self) -> bool:
-        '''Checks if there are more commands to parse.'''
-        return self.instruction_index < self.n_instructions
+class Command(NamedTuple):
+    """A classified VM command. For arithmetic commands arg1 is the operation itself."""
+    type: CMD
+    arg1: str = ""
+    arg2: int = 0
 
-    def advance(self) -> bool:
-        '''Advances to the next command in the instruction list.'''
-        if self.has_more_commands():
-            self.instruction = self.instructions[self.instruction_index]
-            self.instruction_index += 1
-            self.tokens = self.instruction.split()
-            self.keyword = self.tokens[0]
-            return True
-        return False
 
-    def command_type(self) -> CMD:
-        '''Determines the type of the current command.'''
+def parse_line(line: str) -> Command | None:
+    '''Tokenizes and classifies one line; returns None for blank and comment lines.'''
+    tokens = line.split("//", 1)[0].split()
+    if not tokens:
+        return None
+    keyword = tokens[0]
+    cmd_type, n_tokens = COMMAND_MAP.get(keyword, (None, 0))
+    if len(tokens) != n_tokens:
+        raise ValueError(f"Unknown command type: {' '.join(tokens)}")
+    match n_tokens:
+        case 1:
+            return Command(cmd_type, keyword) if cmd_type == CMD.ARITHMETIC else Command(cmd_type)
+        case 2:
+            return Command(cmd_type, tokens[1])
+        case _:
+            return Command(cmd_type, tokens[1], int(tokens[2]))
 
-        match (len(self.tokens), self.keyword):
-            case (1, self.keyword) if self.keyword in OPERATION_MAP:
-                return CMD.ARITHMETIC
-            case (3, "push"):
-                return CMD.PUSH
-            case (3, "pop"):
-                return CMD.POP
-            case (2, "label"):
-                return CMD.LABEL
-            case (2, "goto"):
-                return CMD.GOTO
-            case (2, "if-goto"):
-                return CMD.IF_GOTO
-            case (3, "function"):
-                return CMD.FUNCTION
-            case (3, "call"):
-                return CMD.CALL
-            case (1, "return"):
-                return CMD.RETURN
-            case _:
-                raise ValueError(f"Unknown command type: {self.instruction}")
 
-    def arg1(self) -> str:
-        '''Returns the first argument of the current command.'''
-        if len(self.tokens) > 1:
-            return self.tokens[1]
-        raise ValueError("No first argument found.")
+class Parser:
+    """
+    A class to parse VM commands from a file.
+    Iterating over a parser streams the file and yields `Command` records.
+    """
 
-    def arg2(self) -> int:
-        '''Returns the second argument of the current command.'''
-        if len(self.tokens) > 2:
-            return int(self.tokens[2])
-        raise ValueError("No second argument found.")
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    def __iter__(self) -> Iterator[Command]:
+        with open(self.filepath, "r") as f:
+            for line in f:
+                command = parse_line(line)
+                if command is not None:
+                    yield command
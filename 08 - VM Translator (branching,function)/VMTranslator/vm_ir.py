@@ -0,0 +1,216 @@
+"""
+vm_ir.py
+
+A compact, integer-coded representation of a whole VM program. Every command is one
+(op, a, b) triple of ints in a flat array('i'):
+
+    push/pop        (PUSH|POP, segment, index)
+    arithmetic      (ADD..NOT, 0, 0)
+    label/goto/...  (LABEL|GOTO|IF_GOTO, name, 0)
+    function/call   (FUNCTION|CALL, name, nVars/nArgs)
+    return          (RETURN, 0, 0)
+    file marker     (FILE, name, 0)     start of the commands of one .vm file
+
+Names (labels, functions, file names) are indexes into a string table. On disk (.vmir)
+the program is laid out so a loader can memory-map it without parsing:
+
+    magic "VMIR" | uint32 count | uint32 names_size | int32 code[3 * count] | names (utf-8, newline separated)
+
+All integers are little-endian.
+
+Example usage (dump a .vmir back to VM text):
+    python3 vm_ir.py Pong.vmir
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+from enum import IntEnum
+
+from parser import CMD, OPERATION_MAP, Command
+
+_HEADER = struct.Struct("<4sII")
+_MAGIC = b"VMIR"
+IR_EXT = ".vmir"
+
+
+class Op(IntEnum):
+    """Opcodes; the arithmetic ones come first, in the order of OPERATION_MAP."""
+    ADD = 0
+    SUB = 1
+    NEG = 2
+    EQ = 3
+    GT = 4
+    LT = 5
+    AND = 6
+    OR = 7
+    NOT = 8
+    PUSH = 9
+    POP = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+    FILE = 17
+
+    @property
+    def keyword(self) -> str:
+        return self.name.lower().replace("_", "-")
+
+
+class Segment(IntEnum):
+    CONSTANT = 0
+    LOCAL = 1
+    ARGUMENT = 2
+    THIS = 3
+    THAT = 4
+    STATIC = 5
+    TEMP = 6
+    POINTER = 7
+
+    @property
+    def keyword(self) -> str:
+        return self.name.lower()
+
+
+_CMD_OPS = {CMD.PUSH: Op.PUSH, CMD.POP: Op.POP, CMD.LABEL: Op.LABEL, CMD.GOTO: Op.GOTO,
+            CMD.IF_GOTO: Op.IF_GOTO, CMD.FUNCTION: Op.FUNCTION, CMD.CALL: Op.CALL,
+            CMD.RETURN: Op.RETURN}
+_OP_CMDS = {op: cmd for cmd, op in _CMD_OPS.items()}
+
+
+class VMProgram:
+    """The (op, a, b) triples of a program plus its table of names."""
+
+    def __init__(self):
+        self.code: array | memoryview = array("i")
+        self.names: list[str] = []
+        self._name_index: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.code) // 3
+
+    def name_index(self, name: str) -> int:
+        """Return the index of a name, registering it on first use."""
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def add(self, op: Op, a: int = 0, b: int = 0) -> None:
+        self.code.extend((op, a, b))
+
+    def add_command(self, command: Command) -> None:
+        """Encode a parsed command."""
+        match command.type:
+            case CMD.ARITHMETIC:
+                if command.arg1 not in OPERATION_MAP:
+                    raise ValueError(f"Unknown arithmetic command: {command.arg1}")
+                self.add(Op[command.arg1.upper()])
+            case CMD.PUSH | CMD.POP:
+                try:
+                    segment = Segment[command.arg1.upper()]
+                except KeyError:
+                    raise ValueError(f"Unknown segment: {command.arg1}") from None
+                self.add(_CMD_OPS[command.type], segment, command.arg2)
+            case CMD.RETURN:
+                self.add(Op.RETURN)
+            case _:
+                self.add(_CMD_OPS[command.type], self.name_index(command.arg1), command.arg2)
+
+    def add_file(self, file_name: str, commands: Iterable[Command]) -> None:
+        """Append the commands of one .vm file, preceded by its FILE marker."""
+        self.add(Op.FILE, self.name_index(file_name))
+        for command in commands:
+            self.add_command(command)
+
+    def __iter__(self) -> Iterator[tuple[Op, int, int]]:
+        code = self.code
+        for i in range(0, len(code), 3):
+            yield Op(code[i]), code[i + 1], code[i + 2]
+
+    def commands(self) -> Iterator[tuple[str, Command | None]]:
+        """
+        Decode the program back into (file name, command) pairs, e.g. for dump(); a FILE
+        marker yields (its name, None). The translator iterates the triples directly.
+        """
+        names = self.names
+        file_name = ""
+        for op, a, b in self:
+            if op == Op.FILE:
+                file_name = names[a]
+                yield file_name, None
+            elif op <= Op.NOT:
+                yield file_name, Command(CMD.ARITHMETIC, op.keyword)
+            elif op in (Op.PUSH, Op.POP):
+                yield file_name, Command(_OP_CMDS[op], Segment(a).keyword, b)
+            elif op == Op.RETURN:
+                yield file_name, Command(CMD.RETURN)
+            else:
+                yield file_name, Command(_OP_CMDS[op], names[a], b)
+
+    def dump(self) -> str:
+        """The program as VM text, one `// file` comment per FILE marker."""
+        lines = []
+        for file_name, command in self.commands():
+            if command is None:
+                lines.append(f"// {file_name}")
+                continue
+            match command.type:
+                case CMD.ARITHMETIC:
+                    lines.append(command.arg1)
+                case CMD.RETURN:
+                    lines.append("return")
+                case CMD.LABEL | CMD.GOTO | CMD.IF_GOTO:
+                    lines.append(f"{_CMD_OPS[command.type].keyword} {command.arg1}")
+                case _:
+                    lines.append(f"{_CMD_OPS[command.type].keyword} {command.arg1} {command.arg2}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_path: str) -> None:
+        names = "\n".join(self.names).encode()
+        code = array("i", self.code)
+        if sys.byteorder == "big":
+            code.byteswap()
+        with open(output_path, "wb") as out_f:
+            out_f.write(_HEADER.pack(_MAGIC, len(self), len(names)))
+            out_f.write(code.tobytes())
+            out_f.write(names)
+
+    @classmethod
+    def load(cls, input_path: str) -> "VMProgram":
+        """Memory-map a .vmir file; the code is a view into the mapped pages."""
+        with open(input_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, names_size = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a VM IR file: {input_path}")
+        program = cls()
+        view = memoryview(mapped)
+        start = _HEADER.size
+        end = start + 12 * count
+        if sys.byteorder == "big":
+            program.code = array("i", view[start:end].cast("i"))
+            program.code.byteswap()
+        else:
+            program.code = view[start:end].cast("i")
+        program.names = bytes(view[end:end + names_size]).decode().split("\n") if names_size else []
+        program._name_index = {name: i for i, name in enumerate(program.names)}
+        return program
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", help=f"IR file to read ({IR_EXT})")
+    args = parser.parse_args()
+    sys.stdout.write(VMProgram.load(args.filepath).dump())
+
+
+if __name__ == "__main__":
+    main()